@@ -1,77 +1,196 @@
 """Teoria de circuitos."""
+import time
 import uuid
+import inspect
 import logging
+import itertools
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from types import MappingProxyType
 from string import Template
 import numpy as np
 
-__all__ = ['PowerSrc', 'Transducers', 'FlowSrc', 'Simulator', 'Element']
+try:
+    from scipy import linalg as dense_linalg
+    from scipy import sparse
+    from scipy.sparse import csgraph
+    from scipy.sparse import linalg as sparse_linalg
+except ImportError:
+    dense_linalg = None
+    sparse = None
+    csgraph = None
+    sparse_linalg = None
+
+__all__ = ['PowerSrc', 'Transducers', 'Pipe', 'Tank', 'Inertia', 'FlowSrc', 'Simulator',
+           'Element', 'SimulationStats', 'SimulationResult']
 
 TYPE_ERROR_STR = Template('Only allowed $value of type $type')
 
-def _find_node(pin, lon):
-    """Return node index in lon."""
-    for index, node in  enumerate(lon):
-        if pin in node:
-            return index
-    return None
+# Unknown nodes from which the nodal system is solved as a sparse matrix (scipy required).
+SPARSE_MIN_UNKNOWNS = 200
+
+# Fraction of non zero coefficients from which a system is solved as a dense matrix.
+DENSE_MIN_DENSITY = 0.1
+
+# Unknown nodes from which symmetric positive definite systems are solved by conjugate
+# gradient, where a sparse LU fill-in grows too big.
+CG_MIN_UNKNOWNS = 500000
+
+# Relative residual tolerance of the conjugate gradient solver.
+CG_TOLERANCE = 1e-10
+
+# Keyword of the relative tolerance of scipy's conjugate gradient: rtol since scipy 1.12, tol
+# before (scipy 1.10 is the last release for the Python 3.8 backend image).
+CG_TOLERANCE_KEYWORD = 'rtol' if sparse_linalg is None or \
+    'rtol' in inspect.signature(sparse_linalg.cg).parameters else 'tol'
+
+# Preconditioners of the conjugate gradient solver: diagonal and incomplete Cholesky.
+CG_PRECONDITIONERS = ('jacobi', 'ic')
+
+# Transducers whose resistance may change before the nodal matrix is factorized again.
+MAX_RANK_UPDATES = 8
+
+# Reciprocal condition number under which a low-rank update is replaced by a factorization.
+CAPACITANCE_RCOND = 1e-10
+
+# Mean nodes per tree level from which acyclic circuits are solved with the tree sweep.
+TREE_LEVEL_WIDTH = 32
+
+# Flow below which the head loss of a Pipe is taken as linear, keeping its slope finite.
+PIPE_LAMINAR_FLOW = 1e-6
+
+# Newton iterations of circuits with pipes: step tolerance relative to the node powers,
+# iteration limit and step ratio (to the previous step) from which the Jacobian is updated.
+NEWTON_TOLERANCE = 1e-9
+NEWTON_MAX_ITERATIONS = 50
+JACOBIAN_REUSE_RATIO = 0.25
+
+# Newton iterations a tick may take before the next tick takes the Jacobian again.
+NEWTON_REUSE_ITERATIONS = 3
+
+# Integration methods of simulate_transient, the first one by default.
+TRANSIENT_METHODS = ('trapezoidal', 'backward_euler')
+
+# Levenberg-Marquardt iterations of calibrate: relative cost decrease tolerance and limit.
+CALIBRATION_TOLERANCE = 1e-10
+CALIBRATION_MAX_ITERATIONS = 100
+
+class _DisjointSet:
+    """Union-find structure with path compression and union by size."""
+
+    def __init__(self):
+        """Initialize an empty forest."""
+        self._parent = dict()
+        self._size = dict()
+
+    def find(self, item):
+        """Return the root item of the set containing item."""
+        root = self._parent.setdefault(item, item)
+        while self._parent[root] != root:
+            root = self._parent[root]
+        while item != root:
+            self._parent[item], item = root, self._parent[item]
+        return root
+
+    def union(self, item_a, item_b):
+        """Merge the sets containing item_a and item_b."""
+        root_a = self.find(item_a)
+        root_b = self.find(item_b)
+        if root_a == root_b:
+            return
+        if self._size.get(root_a, 1) < self._size.get(root_b, 1):
+            root_a, root_b = root_b, root_a
+        self._parent[root_b] = root_a
+        self._size[root_a] = self._size.get(root_a, 1) + self._size.pop(root_b, 1)
 
 class Element:
-    """Element class."""
+    """Element class.
+       Once registered in a Simulator the values are stored in its component table and the
+       element is only a view of its row.
+    """
+
+    __slots__ = ('_ddp', '_res', '_cur', '_exponent', '_storage', '_one', '_two', '_table',
+                 '_row')
+    KIND = -1
 
     def __init__(self):
         """Initialize Base Properties."""
         self._ddp = float('inf')
         self._res = float('inf')
         self._cur = float('inf')
-        self._one = uuid.uuid4()
-        self._two = uuid.uuid4()
+        self._exponent = 1.0
+        self._storage = 0.0
+        self._one = None
+        self._two = None
+        self._table = None
+        self._row = -1
 
     @property
     def one(self):
-        """Object connected in Pin 1."""
+        """Object connected in Pin 1.
+           A uuid generated on first use, or an integer given by a Simulator with int_pins.
+        """
+        if self._one is None:
+            self._one = uuid.uuid4()
         return self._one
 
     @property
     def two(self):
-        """Object connected in Pin 2."""
+        """Object connected in Pin 2.
+           A uuid generated on first use, or an integer given by a Simulator with int_pins.
+        """
+        if self._two is None:
+            self._two = uuid.uuid4()
         return self._two
 
     @property
     def ddp(self):
         """Property of ddp."""
-        return self._ddp
+        return self._ddp if self._table is None else self._table.ddp[self._row]
 
     @ddp.setter
     def ddp(self, val):
         if not isinstance(val, float):
             raise TypeError(TYPE_ERROR_STR.substitute(value='val', type='float'))
-        self._ddp = val
+        if self._table is None:
+            self._ddp = val
+        else:
+            self._table.ddp[self._row] = val
 
     @property
     def res(self):
         """Property of res."""
-        return self._res
+        return self._res if self._table is None else self._table.res[self._row]
 
     @res.setter
     def res(self, val):
         if not isinstance(val, float):
             raise TypeError(TYPE_ERROR_STR.substitute(value='val', type='float'))
-        self._res = val
+        if self._table is None:
+            self._res = val
+        else:
+            self._table.res[self._row] = val
 
     @property
     def cur(self):
         """Property of cur."""
-        return self._cur
+        return self._cur if self._table is None else self._table.cur[self._row]
 
     @cur.setter
     def cur(self, val):
         if not isinstance(val, float):
             raise TypeError(TYPE_ERROR_STR.substitute(value='val', type='float'))
-        self._cur = val
+        if self._table is None:
+            self._cur = val
+        else:
+            self._table.cur[self._row] = val
 
 class PowerSrc(Element):
     """Power Generator Element."""
 
+    __slots__ = ()
+    KIND = 0
+
     def __init__(self, **kwargs):
         """Initialize PowerSrc Properties."""
         super().__init__()
@@ -80,19 +199,1340 @@ class PowerSrc(Element):
 class Transducers(Element):
     """Transducers Element."""
 
+    __slots__ = ()
+    KIND = 1
+
     def __init__(self, **kwargs):
         """Initialize Transducers Properties."""
         super().__init__()
         self._res = kwargs.pop('res', float('inf'))
 
+class Pipe(Transducers):
+    """Pipe Element: a transducer with nonlinear head loss.
+       The ddp (head loss) follows ddp = res·|cur|^(exponent - 1)·cur, with res the resistance
+       coefficient: exponent 2 is the Darcy-Weisbach law, 1.852 the Hazen-Williams one.
+       Below PIPE_LAMINAR_FLOW the head loss is linear.
+    """
+
+    __slots__ = ()
+    KIND = 3
+
+    def __init__(self, **kwargs):
+        """Initialize Pipe Properties."""
+        exponent = kwargs.pop('exponent', 2.0)
+        super().__init__(**kwargs)
+        self._exponent = exponent
+
+    @property
+    def exponent(self):
+        """Property of exponent."""
+        return self._exponent if self._table is None else self._table.exponent[self._row]
+
+    @exponent.setter
+    def exponent(self, val):
+        if not isinstance(val, float):
+            raise TypeError(TYPE_ERROR_STR.substitute(value='val', type='float'))
+        if self._table is None:
+            self._exponent = val
+        else:
+            self._table.exponent[self._row] = val
+
+class Tank(Transducers):
+    """Tank Element: a capacitive transducer storing flow.
+       Its flow follows cur = cap·d(ddp)/dt, with cap the capacitance (the tank area, for
+       heads in length units) and ddp its level. Out of simulate_transient a tank is at
+       rest: no flow goes through it.
+    """
+
+    __slots__ = ()
+    KIND = 4
+
+    def __init__(self, **kwargs):
+        """Initialize Tank Properties."""
+        super().__init__()
+        self._ddp = kwargs.pop('ddp', 0.0)
+        self._storage = kwargs.pop('cap', 0.0)
+
+    @property
+    def cap(self):
+        """Property of cap."""
+        return self._storage if self._table is None else self._table.storage[self._row]
+
+    @cap.setter
+    def cap(self, val):
+        if not isinstance(val, float):
+            raise TypeError(TYPE_ERROR_STR.substitute(value='val', type='float'))
+        if self._table is None:
+            self._storage = val
+        else:
+            self._table.storage[self._row] = val
+
+class Inertia(Transducers):
+    """Inertia Element: a transducer with the inertia of its water column.
+       Its ddp follows ddp = res·cur + ind·d(cur)/dt, with ind the inertance. Out of
+       simulate_transient it is a plain transducer.
+    """
+
+    __slots__ = ()
+    KIND = 5
+
+    def __init__(self, **kwargs):
+        """Initialize Inertia Properties."""
+        inertance = kwargs.pop('ind', 0.0)
+        super().__init__(**kwargs)
+        self._storage = inertance
+
+    @property
+    def ind(self):
+        """Property of ind."""
+        return self._storage if self._table is None else self._table.storage[self._row]
+
+    @ind.setter
+    def ind(self, val):
+        if not isinstance(val, float):
+            raise TypeError(TYPE_ERROR_STR.substitute(value='val', type='float'))
+        if self._table is None:
+            self._storage = val
+        else:
+            self._table.storage[self._row] = val
+
+# Kinds of the Transducers and their subclasses in the component table.
+TRANSDUCER_KINDS = (Transducers.KIND, Pipe.KIND, Tank.KIND, Inertia.KIND)
+
 class FlowSrc(Element):
     """Flow Generator Element."""
 
+    __slots__ = ()
+    KIND = 2
+
     def __init__(self, **kwargs):
         """Initialize FlowSrc Properties."""
         super().__init__()
         self._cur = kwargs.pop('cur', float('inf'))
 
+class SimulationStats:
+    """Profiling information of a simulate() call.
+       timings holds the seconds spent in each phase, counters the sizes and solver work and
+       solver the name of the solver backend used (joined with '+' when the islands used
+       different ones).
+    """
+
+    def __init__(self):
+        """Start the first phase clock."""
+        self.timings = dict()
+        self.counters = dict()
+        self.solver = None
+        self._last = time.perf_counter()
+
+    def lap(self, phase):
+        """Charge the time since the previous lap to a phase."""
+        now = time.perf_counter()
+        self.timings[phase] = self.timings.get(phase, 0.0) + now - self._last
+        self._last = now
+
+    def count(self, counter, value=1):
+        """Add a value to a counter."""
+        self.counters[counter] = self.counters.get(counter, 0) + value
+
+    @property
+    def total(self):
+        """Seconds spent in all the phases."""
+        return sum(self.timings.values())
+
+    def __repr__(self):
+        timings = ', '.join(f'{phase}={1e3*value:.3f}ms' for phase, value in self.timings.items())
+        counters = ', '.join(f'{counter}={value}' for counter, value in self.counters.items())
+        return f'SimulationStats({timings}; {counters}; solver={self.solver})'
+
+class SimulationResult:
+    """Immutable snapshot of a simulation.
+       The ddp, res and cur arrays are indexed by the names map and node_powers by the topology
+       node numbering. The arrays are read-only, so a result can be shared without copies.
+    """
+
+    __slots__ = ('_tick', '_names', '_ddp', '_res', '_cur', '_node_powers')
+
+    def __init__(self, tick, names, ddp, res, cur, node_powers):
+        """Freeze the result arrays."""
+        for values in (ddp, res, cur, node_powers):
+            values.flags.writeable = False
+        self._tick = tick
+        self._names = names
+        self._ddp = ddp
+        self._res = res
+        self._cur = cur
+        self._node_powers = node_powers
+
+    @property
+    def tick(self):
+        """Simulation number in its Simulator."""
+        return self._tick
+
+    @property
+    def names(self):
+        """Read-only component name to array index map."""
+        return self._names
+
+    @property
+    def ddp(self):
+        """Component ddp array."""
+        return self._ddp
+
+    @property
+    def res(self):
+        """Component res array."""
+        return self._res
+
+    @property
+    def cur(self):
+        """Component cur array."""
+        return self._cur
+
+    @property
+    def node_powers(self):
+        """Node powers array."""
+        return self._node_powers
+
+    def __getitem__(self, name):
+        """Return the [ddp, res, cur] values of a component."""
+        index = self._names[name]
+        return [float(self._ddp[index]), float(self._res[index]), float(self._cur[index])]
+
+    def to_dict(self):
+        """Return the [ddp, res, cur] values of every component by name."""
+        return {name: self[name] for name in self._names}
+
+class _ComponentTable:
+    """Struct-of-arrays storage of the components registered in a Simulator.
+       Rows follow the registration order and every registered Element is a view of its row.
+    """
+
+    COLUMNS = ('ddp', 'res', 'cur', 'exponent', 'storage', 'kind', 'pin_one', 'pin_two')
+
+    def __init__(self):
+        """Initialize empty columns."""
+        self.size = 0
+        self.ddp = np.empty(0)
+        self.res = np.empty(0)
+        self.cur = np.empty(0)
+        self.exponent = np.empty(0)
+        self.storage = np.empty(0)
+        self.kind = np.empty(0, dtype=np.int8)
+        self.pin_one = np.empty(0, dtype=int)
+        self.pin_two = np.empty(0, dtype=int)
+        self.views = list()
+
+    def append(self, element, pin_ids=(-1, -1)):
+        """Move the element values to a new row and bind the element to it.
+           pin_ids are the integer ids of its pins given by the Simulator.
+        """
+        if self.size == len(self.ddp):
+            capacity = max(16, 2*self.size)
+            for column in self.COLUMNS:
+                values = getattr(self, column)
+                grown = np.empty(capacity, dtype=values.dtype)
+                grown[:self.size] = values[:self.size]
+                setattr(self, column, grown)
+
+        row = self.size
+        self.ddp[row] = element._ddp
+        self.res[row] = element._res
+        self.cur[row] = element._cur
+        self.exponent[row] = element._exponent
+        self.storage[row] = element._storage
+        self.kind[row] = element.KIND
+        self.pin_one[row], self.pin_two[row] = pin_ids
+        self.views.append(element)
+        element._table = self
+        element._row = row
+        self.size += 1
+
+    def remove(self, row):
+        """Remove a row, giving its values back to the detached element."""
+        element = self.views.pop(row)
+        element._ddp = float(self.ddp[row])
+        element._res = float(self.res[row])
+        element._cur = float(self.cur[row])
+        element._exponent = float(self.exponent[row])
+        element._storage = float(self.storage[row])
+        element._table = None
+        element._row = -1
+
+        for column in self.COLUMNS:
+            values = getattr(self, column)
+            values[row:self.size - 1] = values[row + 1:self.size]
+        self.size -= 1
+        for index in range(row, self.size):
+            self.views[index]._row = index
+
+class _Topology:
+    """Compiled circuit topology.
+       Node numbering, incidence arrays and known/unknown node partitions of a circuit. It is
+       valid while no component is (de)registered or connected and the reference is unchanged,
+       so only the component values have to be read on every simulation.
+
+       The net list follows the component table rows, so component indexes are table rows.
+
+       The equations follow the modified nodal analysis: the unknowns are the unknown node
+       powers followed by the flow of every floating PowerSrc (not touching the reference
+       node), with one more equation per floating source fixing its ddp:
+
+           | G   B | |v|   |i|
+           | Bᵀ  0 | |j| = |e|
+
+       With reduce the transducers are merged in series and parallel branches first (see
+       _Reduction), and the equations are written for those branches. Circuits with pipes,
+       tanks or inertias are not reduced: their flows are not linear in the ddp.
+    """
+
+    def __init__(self, table, names, node_list, comp_nodes, reference_nodes, node_islands,
+                 unknown_nodes, reduce=False):
+        """Build the incidence arrays of the node equations.
+           comp_nodes holds the pin one and pin two node arrays of the components and
+           reference_nodes the reference node of every island, the main one first.
+        """
+        self.table = table
+        self.names = MappingProxyType(dict(zip(names, range(len(names)))))
+        self.node_list = node_list
+        self.reference_node = reference_nodes[0]
+        self.reference_nodes = reference_nodes
+        self.node_islands = node_islands
+        kinds = table.kind[:table.size]
+        self.transducer_index = np.flatnonzero(np.isin(kinds, TRANSDUCER_KINDS))
+        self.flow_index = np.flatnonzero(kinds == FlowSrc.KIND)
+        self.power_index = np.flatnonzero(kinds == PowerSrc.KIND)
+        self.comp_nodes = comp_one, comp_two = comp_nodes
+
+        # Known node powers: the ddp of a PowerSrc touching the reference node.
+        power_one, power_two = comp_one[self.power_index], comp_two[self.power_index]
+        grounded = np.isin(power_one, reference_nodes) | np.isin(power_two, reference_nodes)
+        self.known_comps = self.power_index[grounded]
+        self.known_nodes = np.where(np.isin(power_one[grounded], reference_nodes),
+                                    power_two[grounded], power_one[grounded])
+        self.known_signs = np.where(self.known_nodes == power_one[grounded], 1.0, -1.0)
+
+        # PowerSrc touching the reference node take the flow balancing its other node:
+        # (node, incidence sign). The floating ones get their flow from the solution.
+        self.grounded_index = self.power_index[grounded]
+        source_one = ~np.isin(power_one[grounded], reference_nodes)
+        self.source_nodes = np.where(source_one, power_one[grounded], power_two[grounded])
+        self.source_signs = np.where(source_one, 1.0, -1.0)
+        self.floating_index = self.power_index[~grounded]
+
+        t_one, t_two = comp_one[self.transducer_index], comp_two[self.transducer_index]
+        self.transducer_nodes = (t_one, t_two)
+        # Pipes, tanks and inertias by transducer index, and their component index.
+        transducer_kinds = kinds[self.transducer_index]
+        self.pipe_positions = np.flatnonzero(transducer_kinds == Pipe.KIND)
+        self.pipe_index = self.transducer_index[self.pipe_positions]
+        self.tank_positions = np.flatnonzero(transducer_kinds == Tank.KIND)
+        self.inertia_positions = np.flatnonzero(transducer_kinds == Inertia.KIND)
+        self.reduce = reduce
+        self.reduction = None
+        if reduce and not any(len(positions) for positions in (
+                self.pipe_positions, self.tank_positions, self.inertia_positions)):
+            self.reduction = _Reduction(len(node_list), unknown_nodes, self.comp_nodes,
+                                        (t_one, t_two))
+            unknown_nodes = self.reduction.unknown_nodes
+            t_one, t_two = self.reduction.branch_nodes
+        self.branch_ends = (t_one, t_two)
+        self.unknown_nodes = unknown_nodes = np.array(unknown_nodes, dtype=int)
+        self.size = len(unknown_nodes) + len(self.floating_index)
+
+        position = np.full(len(node_list), -1)
+        position[unknown_nodes] = np.arange(len(unknown_nodes))
+        f_one, f_two = comp_one[self.flow_index], comp_two[self.flow_index]
+        p_one, p_two = position[t_one], position[t_two]
+        t_index = np.arange(len(t_one))
+        self.transducer_positions = (p_one, p_two)
+
+        # Coefficient entries: (row, col) position, transducer index and conductance sign.
+        diag_one, diag_two, both = p_one >= 0, p_two >= 0, (p_one >= 0) & (p_two >= 0)
+        self.matrix_rows = np.concatenate((p_one[diag_one], p_two[diag_two],
+                                           p_one[both], p_two[both]))
+        self.matrix_cols = np.concatenate((p_one[diag_one], p_two[diag_two],
+                                           p_two[both], p_one[both]))
+        self.matrix_comps = np.concatenate((t_index[diag_one], t_index[diag_two],
+                                            t_index[both], t_index[both]))
+        self.matrix_signs = np.concatenate((np.ones(diag_one.sum() + diag_two.sum()),
+                                            -np.ones(2*both.sum())))
+
+        # Constant entries coupling an unknown node with a known node through a transducer.
+        one_known, two_known = diag_two & ~diag_one, diag_one & ~diag_two
+        self.coupling_rows = np.concatenate((p_two[one_known], p_one[two_known]))
+        self.coupling_comps = np.concatenate((t_index[one_known], t_index[two_known]))
+        self.coupling_nodes = np.concatenate((t_one[one_known], t_two[two_known]))
+
+        # Constant entries of the flow sources.
+        f_index = np.arange(len(f_one))
+        fp_one, fp_two = position[f_one], position[f_two]
+        self.flow_rows = np.concatenate((fp_one[fp_one >= 0], fp_two[fp_two >= 0]))
+        self.flow_comps = np.concatenate((f_index[fp_one >= 0], f_index[fp_two >= 0]))
+        self.flow_signs = np.concatenate((np.ones((fp_one >= 0).sum()),
+                                          -np.ones((fp_two >= 0).sum())))
+
+        # Floating PowerSrc entries: B and Bᵀ blocks, and the known node powers moved to the
+        # constants of its ddp equation.
+        s_one, s_two = power_one[~grounded], power_two[~grounded]
+        sp_one, sp_two = position[s_one], position[s_two]
+        s_rows = len(unknown_nodes) + np.arange(len(s_one))
+        self.branch_rows = np.concatenate((sp_one[sp_one >= 0], sp_two[sp_two >= 0],
+                                           s_rows[sp_one >= 0], s_rows[sp_two >= 0]))
+        self.branch_cols = np.concatenate((s_rows[sp_one >= 0], s_rows[sp_two >= 0],
+                                           sp_one[sp_one >= 0], sp_two[sp_two >= 0]))
+        self.branch_values = np.concatenate((np.ones((sp_one >= 0).sum()),
+                                             -np.ones((sp_two >= 0).sum()),
+                                             np.ones((sp_one >= 0).sum()),
+                                             -np.ones((sp_two >= 0).sum())))
+        self.floating_nodes = (s_one, s_two)
+        self.floating_known = (sp_one < 0, sp_two < 0)
+
+        # Acyclic node equations (no floating sources) are solved with a tree sweep.
+        self.tree = None
+        if len(self.floating_index) == 0:
+            self.tree = _TreeSweep.build(self.matrix_rows, self.matrix_cols, self.size)
+        self._singularity = self._structural_singularity(np.ones(len(t_one), dtype=bool))
+
+        # Islands: the equations are block diagonal, one block per island. Every island keeps
+        # its unknown positions and coefficient entries, and the local position of every
+        # unknown in its block.
+        system_islands = np.concatenate((node_islands[unknown_nodes], node_islands[s_one]))
+        entry_islands = system_islands[np.concatenate((self.matrix_rows, self.branch_rows))]
+        labels, counts = np.unique(system_islands, return_counts=True)
+        order = np.argsort(system_islands, kind='stable')
+        self.local_positions = np.empty(self.size, dtype=int)
+        self.local_positions[order] = np.arange(self.size) - np.repeat(np.cumsum(counts) - counts,
+                                                                       counts)
+        positions = np.split(order, np.cumsum(counts)[:-1])
+        entries = np.split(np.argsort(entry_islands, kind='stable'),
+                           np.cumsum(np.bincount(np.searchsorted(labels, entry_islands),
+                                                 minlength=len(labels)))[:-1])
+        self.islands = list(zip(positions, entries))
+
+    def known_powers(self, ddp=None):
+        """Return the node powers vector with the known nodes solved.
+           ddp holds the PowerSrc ddp by component index (one row per scenario when stacked).
+           The values of the components are used when it is not given.
+        """
+        if ddp is None:
+            ddp = self.table.ddp[:self.table.size]
+        node_powers_vector = np.zeros(ddp.shape[:-1] + (len(self.node_list),))
+        node_powers_vector[..., self.known_nodes] = self.known_signs*ddp[..., self.known_comps]
+        return node_powers_vector
+
+    def conductances(self):
+        """Return the current conductance of every transducer (zero for tanks)."""
+        conductances = 1.0/self.table.res[self.transducer_index]
+        conductances[self.tank_positions] = 0.0
+        return conductances
+
+    def branch_conductances(self, conductances):
+        """Return the conductances of the equation branches from the transducer ones."""
+        if self.reduction is None:
+            return conductances
+        return self.reduction.branch_conductances(conductances)
+
+    def expand(self, node_powers_vector, conductances):
+        """Solve in place the node powers eliminated by the reduction."""
+        if self.reduction is not None:
+            self.reduction.expand(node_powers_vector, conductances)
+
+    def coefficients(self, conductances):
+        """Return the COO coefficients (rows, cols, values) of the node equations from the
+           branch conductances.
+        """
+        values = conductances[..., self.matrix_comps]*self.matrix_signs
+        if len(self.branch_values) == 0:
+            return self.matrix_rows, self.matrix_cols, values
+        branch_values = np.broadcast_to(self.branch_values,
+                                        values.shape[:-1] + self.branch_values.shape)
+        return (np.concatenate((self.matrix_rows, self.branch_rows)),
+                np.concatenate((self.matrix_cols, self.branch_cols)),
+                np.concatenate((values, branch_values), axis=-1))
+
+    def constants(self, node_powers_vector, conductances, currents=None, ddp=None,
+                  transducer_currents=None):
+        """Return the constants vector of the node equations from the branch conductances
+           (one row per scenario when the arguments are stacked). The FlowSrc currents and
+           PowerSrc ddp are read from the components when not given. transducer_currents
+           are flows (pin one to pin two) of the transducers on top of their conductance
+           ones, as the linearized pipes have.
+        """
+        if currents is None:
+            currents = self.table.cur[self.flow_index]
+        if ddp is None:
+            ddp = self.table.ddp[:self.table.size]
+        size = len(self.unknown_nodes)
+
+        constants_vector = _scatter_add(
+            self.coupling_rows,
+            conductances[..., self.coupling_comps]*node_powers_vector[..., self.coupling_nodes],
+            size)
+        constants_vector += _scatter_add(self.flow_rows,
+                                         currents[..., self.flow_comps]*self.flow_signs,
+                                         size)
+        if transducer_currents is not None:
+            p_one, p_two = self.transducer_positions
+            constants_vector -= _scatter_add(p_one[p_one >= 0],
+                                             transducer_currents[..., p_one >= 0], size)
+            constants_vector += _scatter_add(p_two[p_two >= 0],
+                                             transducer_currents[..., p_two >= 0], size)
+        if len(self.floating_index) == 0:
+            return constants_vector
+
+        (s_one, s_two), (known_one, known_two) = self.floating_nodes, self.floating_known
+        source_constants = ddp[..., self.floating_index] \
+            - known_one*node_powers_vector[..., s_one] + known_two*node_powers_vector[..., s_two]
+        return np.concatenate((constants_vector, source_constants), axis=-1)
+
+    def singularity(self, conductances):
+        """Return why the node equations are structurally singular for the branch
+           conductances, or None. They are when an unknown node has no path to a known node
+           through non zero conductances or PowerSrc, or a floating PowerSrc closes a loop of
+           PowerSrc. The answer without zero conductances only depends on the topology, so
+           it is kept.
+        """
+        joined = conductances != 0
+        if np.all(joined):
+            return self._singularity
+        return self._structural_singularity(joined)
+
+    def _structural_singularity(self, joined):
+        """Return why the node equations are singular joining only some branches, or None."""
+        size = len(self.node_list)
+        ground = np.concatenate((self.known_nodes, self.reference_nodes)).astype(int)
+        t_one, t_two = self.branch_ends
+        comp_one, comp_two = self.comp_nodes
+        ends_one = np.concatenate((t_one[joined], comp_one[self.power_index], ground))
+        ends_two = np.concatenate((t_two[joined], comp_two[self.power_index],
+                                   np.full(len(ground), size)))
+        labels = _connected_labels(size + 1, ends_one, ends_two)
+        floating = self.unknown_nodes[labels[self.unknown_nodes] != labels[size]]
+        if len(floating) > 0:
+            return f'Nodes {floating.tolist()} have no path to a known node.'
+
+        sources = _DisjointSet()
+        grounded = set(ground.tolist())
+        s_one, s_two = self.floating_nodes
+        for index, node_one, node_two in zip(self.floating_index.tolist(), s_one.tolist(),
+                                             s_two.tolist()):
+            node_one = size if node_one in grounded else node_one
+            node_two = size if node_two in grounded else node_two
+            if sources.find(node_one) == sources.find(node_two):
+                return f'PowerSrc {index} closes a loop of PowerSrc.'
+            sources.union(node_one, node_two)
+        return None
+
+    def split(self, solutions_vector):
+        """Split a solution in the unknown node powers and the floating PowerSrc flows."""
+        size = len(self.unknown_nodes)
+        return solutions_vector[..., :size], solutions_vector[..., size:]
+
+    def branch_powers(self, node_powers_vector):
+        """Return the power difference (pin one minus pin two) of every component: Aᵀ·v, with
+           A the node x component incidence matrix (+1 at pin one node, -1 at pin two node).
+        """
+        comp_one, comp_two = self.comp_nodes
+        return node_powers_vector[..., comp_one] - node_powers_vector[..., comp_two]
+
+    def node_flows(self, flows):
+        """Return the flow leaving every node through the components: A·i."""
+        comp_one, comp_two = self.comp_nodes
+        size = len(self.node_list)
+        return _scatter_add(comp_one, flows, size) - _scatter_add(comp_two, flows, size)
+
+    def flows(self, node_powers_vector, conductances, currents, source_flows=None,
+              transducer_currents=None):
+        """Return the flow of every component from the solved node powers and floating
+           PowerSrc flows (one row per scenario when the arguments are stacked). Flows go from
+           pin one to pin two. transducer_currents are added to the transducer flows, see
+           constants.
+        """
+        branch_powers = self.branch_powers(node_powers_vector)
+        flows = np.zeros(branch_powers.shape)
+        flows[..., self.transducer_index] = self.transducer_flows(
+            branch_powers[..., self.transducer_index], conductances)
+        if transducer_currents is not None:
+            flows[..., self.transducer_index] += transducer_currents
+        flows[..., self.flow_index] = currents
+        if source_flows is not None:
+            flows[..., self.floating_index] = source_flows
+        # A grounded PowerSrc takes the flow the other components leave at its non reference
+        # node.
+        flows[..., self.grounded_index] = \
+            -self.source_signs*self.node_flows(flows)[..., self.source_nodes]
+        return flows
+
+    def transducer_flows(self, heads, conductances):
+        """Return the flow of every transducer from its ddp (head): linear in the conductance
+           (1/res), or following the head loss law of the pipes.
+        """
+        flows = heads*conductances
+        if len(self.pipe_positions) == 0:
+            return flows
+        pipes = self.pipe_positions
+        heads, conductances = heads[..., pipes], conductances[..., pipes]
+        exponents = self.table.exponent[self.pipe_index]
+        laminar = PIPE_LAMINAR_FLOW**(1.0 - exponents)*conductances
+        turbulent = np.sign(heads)*(np.abs(heads)*conductances)**(1.0/exponents)
+        flows[..., pipes] = np.where(np.abs(heads*laminar) <= PIPE_LAMINAR_FLOW,
+                                     heads*laminar, turbulent)
+        return flows
+
+    def flow_slopes(self, heads, conductances):
+        """Return the derivative of every transducer flow with its ddp (head), the
+           conductance of the transducers linearized at those heads.
+        """
+        if len(self.pipe_positions) == 0:
+            return conductances
+        slopes = np.array(conductances, dtype=float)
+        pipes = self.pipe_positions
+        heads, conductances = np.abs(heads[..., pipes]), conductances[..., pipes]
+        exponents = self.table.exponent[self.pipe_index]
+        laminar = PIPE_LAMINAR_FLOW**(1.0 - exponents)*conductances
+        transition = PIPE_LAMINAR_FLOW/laminar
+        slopes[..., pipes] = np.where(
+            heads <= transition, laminar,
+            (np.maximum(heads, transition)*conductances)**(1.0/exponents) /
+            (exponents*np.maximum(heads, transition)))
+        return slopes
+
+    def imbalance(self, node_powers_vector, conductances, source_flows=None):
+        """Return the flow leaving every unknown node through the components, zero when the
+           node powers solve the circuit.
+        """
+        flows = self.flows(node_powers_vector, conductances, self.table.cur[self.flow_index],
+                           source_flows)
+        return self.node_flows(flows)[self.unknown_nodes]
+
+    def meter_terms(self, meters):
+        """Return the flows of some components as sums of transducer flows and floating
+           PowerSrc flows (their rows in the solutions vector), FlowSrc flows left out:
+           (meter rows, transducer positions, signs) and (meter rows, positions, signs).
+           A grounded PowerSrc takes the flows of the other components at its node.
+        """
+        t_one, t_two = self.transducer_nodes
+        s_one, s_two = self.floating_nodes
+        transducer_position = np.full(len(self.names), -1)
+        transducer_position[self.transducer_index] = np.arange(len(self.transducer_index))
+        transducer_terms, source_terms = [], []
+        for row, meter in enumerate(meters):
+            if transducer_position[meter] >= 0:
+                transducer_terms.append(([row], [transducer_position[meter]], [1.0]))
+            elif meter in self.floating_index:
+                source = len(self.unknown_nodes) + np.flatnonzero(self.floating_index == meter)
+                source_terms.append(([row], source, [1.0]))
+            elif meter in self.grounded_index:
+                source = np.flatnonzero(self.grounded_index == meter)[0]
+                node, sign = self.source_nodes[source], self.source_signs[source]
+                for ones, twos, terms, offset in ((t_one, t_two, transducer_terms, 0),
+                                                  (s_one, s_two, source_terms,
+                                                   len(self.unknown_nodes))):
+                    positions = np.concatenate((np.flatnonzero(ones == node),
+                                                np.flatnonzero(twos == node)))
+                    signs = -sign*np.concatenate((np.ones((ones == node).sum()),
+                                                  -np.ones((twos == node).sum())))
+                    terms.append(([row]*len(positions), positions + offset, signs))
+        return tuple(tuple(np.concatenate([term[part] for term in terms] + [[]]).astype(kind)
+                           for part, kind in enumerate((int, int, float)))
+                     for terms in (transducer_terms, source_terms))
+
+    def meter_changes(self, changes, conductances, meters):
+        """Return the changes of the flows of some components (one row per column of
+           changes) for changes of the solutions vector at fixed known powers, FlowSrc cur
+           and conductances.
+        """
+        if self.reduction is None:
+            transducer_terms, source_terms = self.meter_terms(meters)
+            rows, positions, signs = transducer_terms
+            flows = conductances[positions][:, None]*self.project(changes, positions)
+            source_rows, source_positions, source_signs = source_terms
+            return _scatter_add(rows, signs*flows.T, len(meters)) + \
+                _scatter_add(source_rows, source_signs*changes[source_positions].T, len(meters))
+        node_powers_vector = np.zeros((changes.shape[1], len(self.node_list)))
+        unknown_changes, source_changes = self.split(changes.T)
+        node_powers_vector[:, self.unknown_nodes] = unknown_changes
+        self.expand(node_powers_vector, conductances)
+        flows = self.flows(node_powers_vector, conductances, np.zeros(len(self.flow_index)),
+                           source_changes)
+        return flows[:, meters]
+
+    def incidence_columns(self, comps):
+        """Return the unknown incidence columns (e_one - e_two) of some branches."""
+        p_one, p_two = self.transducer_positions
+        columns = np.zeros((self.size + 1, len(comps)))
+        columns[p_one[comps], np.arange(len(comps))] += 1.0
+        columns[p_two[comps], np.arange(len(comps))] -= 1.0
+        # Known nodes have position -1 and land on the discarded last row.
+        return columns[:-1]
+
+    def project(self, vector, comps):
+        """Return the branches incidence columns transposed times a vector (or matrix)."""
+        p_one, p_two = self.transducer_positions
+        padded = np.concatenate((vector, np.zeros((1,) + vector.shape[1:])))
+        return padded[p_one[comps]] - padded[p_two[comps]]
+
+
+class _Reduction:
+    """Series and parallel reduction of the transducers.
+       An unknown node joining exactly two transducers (and nothing else) is eliminated: the
+       transducers between two kept nodes form a series chain with resistance the sum of
+       theirs. Chains and transducers joining the same kept nodes are merged in parallel, with
+       conductance the sum of theirs. After the solve the eliminated node powers are expanded
+       back from the chain flows.
+    """
+
+    def __init__(self, node_count, unknown_nodes, comp_nodes, transducer_nodes):
+        """Find the series chains and parallel branches of the transducers."""
+        comp_one, comp_two = comp_nodes
+        t_one, t_two = transducer_nodes
+        degree = np.bincount(comp_one, minlength=node_count) + \
+            np.bincount(comp_two, minlength=node_count)
+        transducer_degree = np.bincount(t_one, minlength=node_count) + \
+            np.bincount(t_two, minlength=node_count)
+        eliminated = np.zeros(node_count, dtype=bool)
+        eliminated[unknown_nodes] = True
+        eliminated &= (degree == 2) & (transducer_degree == 2)
+        eliminated[t_one[t_one == t_two]] = False
+
+        # The two transducers of every eliminated node.
+        node_transducers = dict()
+        for index, (node_one, node_two) in enumerate(zip(t_one.tolist(), t_two.tolist())):
+            for node in (node_one, node_two):
+                if eliminated[node]:
+                    node_transducers.setdefault(node, list()).append(index)
+
+        # Walk every chain from a transducer with a kept node.
+        series_index = np.full(len(t_one), -1)
+        branch_ends, segments, internal_nodes, internal_segments = list(), list(), list(), list()
+        chain_ends, chain_of_segment, chain_of_internal = list(), list(), list()
+        for index, (node_one, node_two) in enumerate(zip(t_one.tolist(), t_two.tolist())):
+            if series_index[index] >= 0:
+                continue
+            branch = len(branch_ends)
+            if not eliminated[node_one] and not eliminated[node_two]:
+                series_index[index] = branch
+                branch_ends.append((node_one, node_two))
+                continue
+            if eliminated[node_one] and eliminated[node_two]:
+                continue
+            start, node, comp = (node_two, node_one, index) if eliminated[node_one] \
+                else (node_one, node_two, index)
+            chain = len(chain_ends)
+            while True:
+                series_index[comp] = branch
+                chain_of_segment.append(chain)
+                segments.append(comp)
+                if not eliminated[node]:
+                    break
+                internal_nodes.append(node)
+                internal_segments.append(len(segments) - 1)
+                chain_of_internal.append(chain)
+                pair = node_transducers[node]
+                comp = pair[1] if pair[0] == comp else pair[0]
+                node = t_two[comp] if t_one[comp] == node else t_one[comp]
+            branch_ends.append((start, node))
+            chain_ends.append((start, node))
+
+        self.unknown_nodes = [node for node in unknown_nodes if not eliminated[node]]
+        self.series_index = series_index
+        self.series_count = len(branch_ends)
+
+        # Merge the series branches joining the same nodes.
+        parallel = dict()
+        self.parallel_index = np.array([parallel.setdefault((min(ends), max(ends)),
+                                                            len(parallel))
+                                        for ends in branch_ends], dtype=int)
+        self.branch_nodes = tuple(np.array(list(parallel), dtype=int).reshape(-1, 2).T)
+
+        chain_ends = np.array(chain_ends, dtype=int).reshape(-1, 2)
+        self.chain_starts, self.chain_ends = chain_ends[:, 0], chain_ends[:, 1]
+        self.segments = np.array(segments, dtype=int)
+        self.chain_of_segment = np.array(chain_of_segment, dtype=int)
+        self.chain_first = np.flatnonzero(np.diff(self.chain_of_segment, prepend=-1))
+        self.chain_last = np.append(self.chain_first[1:], len(segments)) - 1
+        self.internal_nodes = np.array(internal_nodes, dtype=int)
+        self.internal_segments = np.array(internal_segments, dtype=int)
+        self.chain_of_internal = np.array(chain_of_internal, dtype=int)
+
+    def branch_conductances(self, conductances):
+        """Return the merged branch conductances (stackable)."""
+        with np.errstate(divide='ignore'):
+            series = 1.0/_scatter_add(self.series_index, 1.0/conductances, self.series_count)
+        return _scatter_add(self.parallel_index, series, len(self.branch_nodes[0]))
+
+    def expand(self, node_powers_vector, conductances):
+        """Solve the eliminated node powers from the chain flows (stackable).
+           A chain broken by a closed transducer (zero conductance) carries no flow: its
+           nodes take the power of the chain end they are still joined to.
+        """
+        if len(self.internal_nodes) == 0:
+            return
+        closed = conductances[..., self.segments] == 0
+        with np.errstate(divide='ignore'):
+            resistances = np.where(closed, 0.0, 1.0/conductances[..., self.segments])
+        accumulated = self._chain_cumsum(resistances)
+        breaks = self._chain_cumsum(closed.astype(float))
+        starts = node_powers_vector[..., self.chain_starts]
+        ends = node_powers_vector[..., self.chain_ends]
+        totals = np.where(breaks[..., self.chain_last] > 0, np.inf,
+                          accumulated[..., self.chain_last])
+        flows = (starts - ends)/totals
+        node_powers_vector[..., self.internal_nodes] = np.where(
+            breaks[..., self.internal_segments] > 0, ends[..., self.chain_of_internal],
+            starts[..., self.chain_of_internal] - flows[..., self.chain_of_internal] *
+            accumulated[..., self.internal_segments])
+
+    def _chain_cumsum(self, values):
+        """Return the cumulative sums of the segment values along every chain."""
+        accumulated = np.cumsum(values, axis=-1)
+        offsets = accumulated[..., self.chain_first] - values[..., self.chain_first]
+        return accumulated - offsets[..., self.chain_of_segment]
+
+
+class _TreeSweep:
+    """Backward/forward sweep of acyclic node equations.
+       When the unknown nodes joined by the transducers form a forest, eliminating the nodes
+       from the leaves to the roots adds no new entries (LDLᵀ with the tree as L pattern): the
+       backward sweep moves every node equation to its parent, the forward sweep solves the
+       node powers from the roots to the leaves. Both cost O(n), with one vectorized step per
+       tree level.
+    """
+
+    def __init__(self, order, parents, entries, levels, diagonal_entries, diagonal_rows):
+        """Keep the sweep order (nodes by depth and parent), the parent of every node (-1 for
+           roots), the coefficient entry of every node with its parent, the level bounds in
+           the order and the diagonal coefficient entries and rows.
+        """
+        self.order = order
+        self.parents = parents
+        self.entries = entries
+        self.diagonal_entries = diagonal_entries
+        self.diagonal_rows = diagonal_rows
+        self.roots = order[:levels[1]]
+        self.children = order[levels[1]:]
+        # Levels below the roots, with their nodes grouped by parent.
+        self.steps = list()
+        for start, stop in zip(levels[1:-1], levels[2:]):
+            level = order[start:stop]
+            groups = np.flatnonzero(np.diff(parents[level], prepend=-1))
+            self.steps.append((level, groups, parents[level][groups]))
+
+    @classmethod
+    def build(cls, rows, cols, size):
+        """Return the sweep of a coefficient entries pattern, or None if it has cycles or its
+           levels hold less than TREE_LEVEL_WIDTH nodes on average (deep trees are solved
+           faster by a sparse factorization than level by level).
+        """
+        upper = rows < cols
+        edges = np.unique(np.column_stack((rows[upper], cols[upper])), axis=0)
+        if len(edges) != np.count_nonzero(upper) or len(edges) >= size:
+            return None
+        coupled = np.flatnonzero(rows != cols)
+        adjacency = [list() for _ in range(size)]
+        for entry, row, col in zip(coupled.tolist(), rows[coupled].tolist(),
+                                   cols[coupled].tolist()):
+            adjacency[row].append((col, entry))
+
+        # Breadth first search from a root of every tree, a node reached twice means a cycle.
+        parents = [-2]*size
+        entries = [-1]*size
+        depths = [0]*size
+        order = list()
+        for root in range(size):
+            if parents[root] != -2:
+                continue
+            parents[root] = -1
+            index = len(order)
+            order.append(root)
+            while index < len(order):
+                node = order[index]
+                index += 1
+                for neighbour, entry in adjacency[node]:
+                    if neighbour == parents[node]:
+                        continue
+                    if parents[neighbour] != -2:
+                        return None
+                    parents[neighbour] = node
+                    entries[neighbour] = entry
+                    depths[neighbour] = depths[node] + 1
+                    order.append(neighbour)
+
+        if size < TREE_LEVEL_WIDTH*(max(depths) + 1):
+            return None
+        depths = np.array(depths)
+        parents = np.array(parents, dtype=int)
+        order = np.lexsort((parents, depths))
+        levels = np.append(np.flatnonzero(np.diff(depths[order], prepend=-1)), size)
+        diagonal_entries = np.flatnonzero(rows == cols)
+        return cls(order, parents, np.array(entries, dtype=int), levels, diagonal_entries,
+                   rows[diagonal_entries])
+
+    name = 'tree'
+
+    def factorize(self, rows, cols, values, size):
+        """Return the solve function of the coefficient values (in the pattern COO order).
+           Raises np.linalg.LinAlgError when a pivot is not positive.
+        """
+        pivots = _scatter_add(self.diagonal_rows, values[self.diagonal_entries], size)
+        conductances = np.zeros(size)
+        conductances[self.children] = -values[self.entries[self.children]]
+        weights = np.zeros(size)
+        for level, groups, group_parents in reversed(self.steps):
+            if not np.all(pivots[level] > 0):
+                raise np.linalg.LinAlgError('Tree pivot not positive.')
+            weights[level] = conductances[level]/pivots[level]
+            pivots[group_parents] -= np.add.reduceat(conductances[level]*weights[level], groups)
+        if not np.all(pivots[self.roots] > 0):
+            raise np.linalg.LinAlgError('Tree pivot not positive.')
+
+        def solve(constants_vector):
+            return self.sweep(pivots, weights, conductances, constants_vector)
+        return solve
+
+    def sweep(self, pivots, weights, conductances, constants_vector):
+        """Backward and forward sweeps of a constants vector (or matrix, one column each)."""
+        shape = (-1,) + (1,)*(constants_vector.ndim - 1)
+        accumulated = constants_vector.copy()
+        for level, groups, group_parents in reversed(self.steps):
+            accumulated[group_parents] += np.add.reduceat(
+                weights[level].reshape(shape)*accumulated[level], groups)
+        solutions_vector = np.empty(accumulated.shape)
+        solutions_vector[self.roots] = accumulated[self.roots]/pivots[self.roots].reshape(shape)
+        for level, _, _ in self.steps:
+            solutions_vector[level] = (accumulated[level] + conductances[level].reshape(shape) *
+                                       solutions_vector[self.parents[level]]) / \
+                pivots[level].reshape(shape)
+        return solutions_vector
+
+
+class _DenseSolver:
+    """Dense LAPACK solver: LU factorization, fastest for small systems.
+       Without scipy every solve is a numpy solve of the kept matrix.
+    """
+
+    name = 'dense'
+
+    def factorize(self, rows, cols, values, size):
+        """Return the solve function of a coefficients matrix given by its COO entries.
+           Raises np.linalg.LinAlgError when it is singular (on solve without scipy).
+        """
+        coeficients_matrix = np.zeros((size, size))
+        np.add.at(coeficients_matrix, (rows, cols), values)
+        if dense_linalg is None:
+            return lambda constants: np.linalg.solve(coeficients_matrix, constants)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', dense_linalg.LinAlgWarning)
+            factorization = dense_linalg.lu_factor(coeficients_matrix, check_finite=False)
+        if np.any(np.diagonal(factorization[0]) == 0.0):
+            raise np.linalg.LinAlgError('Singular matrix')
+        return lambda constants: dense_linalg.lu_solve(factorization, constants,
+                                                       check_finite=False)
+
+
+class _SparseSolver:
+    """Sparse direct solver: SuperLU factorization (scipy)."""
+
+    name = 'sparse'
+
+    def factorize(self, rows, cols, values, size):
+        """Return the solve function of a coefficients matrix given by its COO entries.
+           Raises np.linalg.LinAlgError when it is singular.
+        """
+        coeficients_matrix = sparse.coo_matrix((values, (rows, cols)), shape=(size, size))
+        try:
+            return sparse_linalg.splu(coeficients_matrix.tocsc()).solve
+        except RuntimeError as exception:
+            raise np.linalg.LinAlgError(str(exception)) from None
+
+
+class _ConjugateGradientSolver:
+    """Preconditioned conjugate gradient (scipy), for symmetric positive definite systems:
+       passive circuits without floating PowerSrc.
+       Every single solve starts from the previous solution (initial), which barely changes
+       between ticks, so it converges in a few iterations. The preconditioner is the
+       diagonal ('jacobi') or an incomplete Cholesky factorization ('ic'), computed as an
+       incomplete LU with diagonal pivots in natural order. Its threshold dropping does not
+       keep L·U symmetric, which conjugate gradient needs: the preconditioner applies the
+       mean of its solve and its transposed solve, symmetric by construction.
+    """
+
+    name = 'cg'
+
+    def __init__(self, tolerance=CG_TOLERANCE, preconditioner=CG_PRECONDITIONERS[0],
+                 initial=None):
+        """Keep the relative residual tolerance, the preconditioner name and the initial
+           solution of the first solve.
+        """
+        self.tolerance = tolerance
+        self.preconditioner = preconditioner
+        self.initial = initial
+        self.iterations = 0
+
+    def factorize(self, rows, cols, values, size):
+        """Return the solve function of a coefficients matrix given by its COO entries.
+           Raises np.linalg.LinAlgError when the matrix is not positive definite, the solve
+           when it does not converge.
+        """
+        coeficients_matrix = sparse.coo_matrix((values, (rows, cols)),
+                                               shape=(size, size)).tocsr()
+        diagonal = coeficients_matrix.diagonal()
+        if not np.all(diagonal > 0):
+            raise np.linalg.LinAlgError('Matrix is not positive definite.')
+        if self.preconditioner == CG_PRECONDITIONERS[0]:
+            preconditioner = sparse.diags(1.0/diagonal)
+        else:
+            try:
+                factors = sparse_linalg.spilu(coeficients_matrix.tocsc(), permc_spec='NATURAL',
+                                              diag_pivot_thresh=0.0)
+            except RuntimeError as exception:
+                raise np.linalg.LinAlgError(str(exception)) from None
+            preconditioner = sparse_linalg.LinearOperator(
+                (size, size), lambda vector: 0.5*(factors.solve(vector) +
+                                                  factors.solve(vector, 'T')))
+
+        def count(_):
+            self.iterations += 1
+
+        def solve(constants_vector):
+            if constants_vector.ndim > 1:
+                return np.column_stack([iterate(column, None) for column in constants_vector.T])
+            initial = self.initial
+            if initial is None or initial.shape != constants_vector.shape or \
+                    not np.all(np.isfinite(initial)):
+                initial = None
+            self.initial = iterate(constants_vector, initial)
+            return self.initial
+
+        def iterate(constants_vector, initial):
+            solutions_vector, info = sparse_linalg.cg(coeficients_matrix, constants_vector,
+                                                      x0=initial, atol=0.0, M=preconditioner,
+                                                      callback=count,
+                                                      **{CG_TOLERANCE_KEYWORD: self.tolerance})
+            if info != 0:
+                raise np.linalg.LinAlgError(f'Conjugate gradient did not converge ({info}).')
+            return solutions_vector
+        return solve
+
+
+# Solver backend names, see Simulator.solver.
+SOLVERS = (_DenseSolver.name, _SparseSolver.name, _ConjugateGradientSolver.name,
+           _TreeSweep.name)
+
+
+class _Factorization:
+    """Factorized coefficients matrix of a topology.
+       Conductance changes of a few transducers are applied as a low-rank (Woodbury) update
+       of the base factorization: A' = A + U·D·Uᵀ, with U the incidence columns of the changed
+       transducers and D their conductance increments.
+    """
+
+    def __init__(self, topology, conductances, solve, solvers):
+        """Keep the base conductances, solve function and solver backends of the
+           factorization.
+        """
+        self.topology = topology
+        self.conductances = conductances
+        self.solve_base = solve
+        self.solvers = solvers
+        self.solver = _solver_names(solvers)
+        self._columns = dict()
+
+    @property
+    def iterations(self):
+        """Conjugate gradient iterations of the solves so far, None without iterative
+           solvers.
+        """
+        iterative = [solver for solver in self.solvers
+                     if isinstance(solver, _ConjugateGradientSolver)]
+        return sum(solver.iterations for solver in iterative) if iterative else None
+
+    def changed(self, conductances):
+        """Return the transducers whose conductance differs from the factorized one."""
+        return np.flatnonzero(conductances != self.conductances)
+
+    def _base_columns(self, comps):
+        """Return A⁻¹·U for the transducers, solving only the columns not kept from the last
+           update.
+        """
+        missing = [comp for comp in comps if comp not in self._columns]
+        columns = {comp: self._columns[comp] for comp in comps if comp in self._columns}
+        if missing:
+            solved = self.solve_base(self.topology.incidence_columns(missing))
+            for index, comp in enumerate(missing):
+                columns[comp] = solved[:, index]
+        self._columns = columns
+        return np.column_stack([columns[comp] for comp in comps])
+
+    def solve(self, conductances, constants_vector, changed):
+        """Solve the node equations for the given conductances.
+           Raises np.linalg.LinAlgError when the updated matrix is singular.
+        """
+        solutions_vector = self.solve_base(constants_vector)
+        if len(changed) == 0:
+            return solutions_vector
+
+        increments = conductances[changed] - self.conductances[changed]
+        base_columns = self._base_columns(changed)
+        capacitance = np.eye(len(changed)) + \
+            increments[:, None]*self.topology.project(base_columns, changed)
+        if np.linalg.cond(capacitance) > 1.0/CAPACITANCE_RCOND:
+            raise np.linalg.LinAlgError('Ill-conditioned low-rank update.')
+        weights = np.linalg.solve(capacitance,
+                                  increments*self.topology.project(solutions_vector, changed))
+        return solutions_vector - base_columns.dot(weights)
+
+
+class _SensorModel:
+    """Linear map from the source values to the flows of some metered components.
+       With fixed topology and resistances the flows are linear in the PowerSrc ddp and
+       FlowSrc cur (the inputs), so they are a (meters x inputs) matrix times the inputs.
+    """
+
+    def __init__(self, topology, conductances, meters, matrix):
+        """Keep the map and the topology and conductances it is valid for."""
+        self.topology = topology
+        self.conductances = conductances
+        self.meters = meters
+        self.matrix = matrix
+
+    def valid(self, topology, conductances):
+        """Return whether the map holds for a topology and conductances."""
+        return topology is self.topology and np.array_equal(conductances, self.conductances)
+
+    def flows(self, inputs):
+        """Return the metered flows for the inputs (PowerSrc ddp then FlowSrc cur)."""
+        return self.matrix.dot(inputs)
+
+
+class _LeakModel(_SensorModel):
+    """Sensitivity of the flows of some metered components to a leak at every candidate
+       node: the (nodes x meters) changes of the metered flows per unit of flow leaving the
+       node to the reference. The rows are kept normalized, so ranking a measured deviation
+       is one matrix-vector product.
+    """
+
+    def __init__(self, topology, conductances, meters, matrix, nodes):
+        """Keep the sensitivities, the names of their nodes and their normalized rows."""
+        super().__init__(topology, conductances, meters, matrix)
+        self.nodes = nodes
+        self.norms = np.linalg.norm(matrix, axis=1)
+        self.directions = np.divide(matrix, self.norms[:, None], out=np.zeros(matrix.shape),
+                                    where=self.norms[:, None] > 0.0)
+
+    def rank(self, deviations, count=None):
+        """Return the (node, score, leak) candidates best explaining the deviations of the
+           metered flows, best first. score is the cosine between the deviations and the
+           sensitivities of the node, leak the least squares leak flow there.
+        """
+        deviations = np.asarray(deviations, dtype=float)
+        projections = self.directions.dot(deviations)
+        magnitude = np.linalg.norm(deviations)
+        scores = projections/magnitude if magnitude > 0.0 else np.zeros(len(projections))
+        leaks = np.divide(projections, self.norms, out=np.zeros(len(projections)),
+                          where=self.norms > 0.0)
+        order = np.argsort(-scores, kind='stable')[:count]
+        return [(self.nodes[node], float(scores[node]), float(leaks[node])) for node in order]
+
+
+class _StateEstimator:
+    """Weighted least squares estimate of the circuit state from measured transducer flows.
+       The flow of every tap (a transducer joining an unknown node to a reference node) is
+       its model flow plus a demand deviation d (pin one to pin two); the node powers v
+       solve the node equations of the model with those deviations, A·v + E·d = b. The
+       estimate minimizes
+
+           sum_m w_m·(z_m - H_m·v - c_m - F_m·d)² + sum_t d_t²
+
+       for the measured flows z_m with weights w_m, H·v + c + F·d being the estimated
+       meter flows (c the terms of the known nodes). Its normal equations are the sparse
+       symmetric system
+
+           | HᵀWH   HᵀWF       A  | |v|   | HᵀW(z - c) |
+           | FᵀWH   FᵀWF + I   Eᵀ | |d| = | FᵀW(z - c) |
+           | A      E          0  | |u|   | b          |
+
+       Only the constants change with the measurements, so the factorization is kept
+       across ticks.
+    """
+
+    def __init__(self, topology, conductances, weights, equations, positions):
+        """Assemble the normal equations. equations is the unreduced topology they are
+           written for and positions are the transducer positions of the meters.
+        """
+        self.topology = topology
+        self.conductances = conductances
+        self.weights = weights
+        self.equations = equations
+        self.positions = positions
+        self.solve = None
+
+        p_one, p_two = equations.transducer_positions
+        t_one, t_two = equations.transducer_nodes
+        self.taps = np.flatnonzero(((p_one >= 0) & np.isin(t_two, equations.reference_nodes)) |
+                                   ((p_two >= 0) & np.isin(t_one, equations.reference_nodes)))
+        tap_position = np.full(len(conductances), -1)
+        tap_position[self.taps] = np.arange(len(self.taps))
+        size, taps = equations.size, len(self.taps)
+        self.size = 2*size + taps
+
+        # Meter rows over the unknowns (v, d), known nodes and untapped meters at -1.
+        meter_cols = np.stack((p_one[positions], p_two[positions],
+                               np.where(tap_position[positions] < 0, -1,
+                                        size + tap_position[positions])), axis=1)
+        meter_values = np.stack((conductances[positions], -conductances[positions],
+                                 np.ones(len(positions))), axis=1)
+        self.meter_cols, self.meter_values = meter_cols, meter_values
+        rows = np.broadcast_to(meter_cols[:, :, None], (len(positions), 3, 3)).reshape(-1)
+        cols = np.broadcast_to(meter_cols[:, None, :], (len(positions), 3, 3)).reshape(-1)
+        values = (weights[:, None, None]*meter_values[:, :, None] *
+                  meter_values[:, None, :]).reshape(-1)
+        used = (rows >= 0) & (cols >= 0)
+
+        # Tap deviations in the node equations: E = +1 at pin one, -1 at pin two.
+        tap_rows = np.concatenate((p_one[self.taps], p_two[self.taps]))
+        tap_cols = size + np.concatenate((np.arange(taps), np.arange(taps)))
+        tap_values = np.concatenate((np.ones(taps), -np.ones(taps)))
+        tapped = tap_rows >= 0
+        tap_rows, tap_cols, tap_values = tap_rows[tapped], tap_cols[tapped], tap_values[tapped]
+
+        a_rows, a_cols, a_values = equations.coefficients(
+            equations.branch_conductances(conductances))
+        offset = size + taps
+        self.rows = np.concatenate((rows[used], size + np.arange(taps), a_cols, a_rows + offset,
+                                    tap_cols, tap_rows + offset))
+        self.cols = np.concatenate((cols[used], size + np.arange(taps), a_rows + offset, a_cols,
+                                    tap_rows + offset, tap_cols))
+        self.values = np.concatenate((values[used], np.ones(taps), a_values, a_values,
+                                      tap_values, tap_values))
+
+    def valid(self, topology, conductances, weights):
+        """Return whether the estimate holds for a topology, conductances and weights."""
+        return (topology is self.topology and np.array_equal(conductances, self.conductances)
+                and np.array_equal(weights, self.weights))
+
+    def constants(self, node_powers_vector, flows):
+        """Return the constants vector of the normal equations for the measured flows and
+           the node powers vector with the known nodes solved.
+        """
+        equations = self.equations
+        t_one, t_two = equations.transducer_nodes
+        positions = self.positions
+        errors = self.weights*(flows - self.conductances[positions]*(
+            node_powers_vector[t_one[positions]] - node_powers_vector[t_two[positions]]))
+        # Known nodes and untapped meters have column -1 and land on the discarded last row.
+        cols = np.where(self.meter_cols < 0, self.size, self.meter_cols).reshape(-1)
+        meter_constants = _scatter_add(cols, (errors[:, None]*self.meter_values).reshape(-1),
+                                       self.size + 1)[:equations.size + len(self.taps)]
+        return np.concatenate((meter_constants, equations.constants(
+            node_powers_vector, equations.branch_conductances(self.conductances))))
+
+    def currents(self, deviations):
+        """Return the transducer currents of the taps for their demand deviations."""
+        currents = np.zeros(len(self.conductances))
+        currents[self.taps] = deviations
+        return currents
+
+
+class _Integrator:
+    """Companion models of the tanks and inertias for a fixed step integration.
+       A step of backward Euler or of the trapezoidal rule turns every tank (capacitance C)
+       and inertia (resistance R, inertance L) into a conductance G and a current from its
+       ddp v and flow i of the previous step:
+
+                       backward Euler             trapezoidal
+           Tank        C/dt, -G·v                 2C/dt, -(G·v + i)
+           Inertia     1/(R + L/dt), G·L/dt·i     1/(R + 2L/dt), G·((2L/dt - R)·i + v)
+
+       The conductances only change with the resistances, so at a fixed dt one
+       factorization serves every step.
+    """
+
+    def __init__(self, topology, dt, method):
+        """Keep the topology, the step and the method."""
+        self.topology = topology
+        self.dt = dt
+        self.trapezoidal = method == TRANSIENT_METHODS[0]
+        self.factor = 2.0 if self.trapezoidal else 1.0
+
+    def conductances(self, conductances):
+        """Return the transducer conductances of a step."""
+        topology, table = self.topology, self.topology.table
+        conductances = conductances.copy()
+        capacitances = table.storage[topology.transducer_index[topology.tank_positions]]
+        conductances[topology.tank_positions] = self.factor*capacitances/self.dt
+        inertances = table.storage[topology.transducer_index[topology.inertia_positions]]
+        conductances[topology.inertia_positions] = 1.0/(
+            1.0/conductances[topology.inertia_positions] + self.factor*inertances/self.dt)
+        return conductances
+
+    def currents(self, conductances, step_conductances, ddp, cur):
+        """Return the transducer currents of a step from the ddp and cur of the tanks and
+           inertias (by component index) at the previous one.
+        """
+        topology = self.topology
+        currents = np.zeros(len(conductances))
+        tanks, inertias = topology.tank_positions, topology.inertia_positions
+        tank_ddp = ddp[topology.transducer_index[tanks]]
+        currents[tanks] = -step_conductances[tanks]*tank_ddp
+        inertia_cur = cur[topology.transducer_index[inertias]]
+        inertances = self.factor*topology.table.storage[topology.transducer_index[inertias]] / \
+            self.dt
+        if not self.trapezoidal:
+            currents[inertias] = step_conductances[inertias]*inertances*inertia_cur
+            return currents
+        currents[tanks] -= cur[topology.transducer_index[tanks]]
+        currents[inertias] = step_conductances[inertias]*(
+            (inertances - 1.0/conductances[inertias])*inertia_cur +
+            ddp[topology.transducer_index[inertias]])
+        return currents
+
+
+def _scatter_add(rows, values, size):
+    """Sum the values (last axis) into the given rows of a zero vector of the given size.
+       The result is float even without rows (bincount of nothing is int).
+    """
+    if values.ndim == 1:
+        return np.bincount(rows, values, minlength=size).astype(float, copy=False)
+    # One bincount over the scenarios, every one offset to its own block of rows.
+    count = int(np.prod(values.shape[:-1]))
+    offsets = (np.arange(count)*size)[:, None]
+    result = np.bincount((rows + offsets).ravel(), values.reshape(count, values.shape[-1]).ravel(),
+                         minlength=count*size)
+    return result.reshape(values.shape[:-1] + (size,)).astype(float, copy=False)
+
+def _solver_names(solvers):
+    """Return the names of some solver backends, joined with '+' when they differ."""
+    return '+'.join(sorted({solver.name for solver in solvers}))
+
+def _solve_system(solver, rows, cols, values, size, constants_vector):
+    """Factorize and solve a coefficients matrix given by its COO entries."""
+    return solver.factorize(rows, cols, values, size)(constants_vector)
+
+def _leak_columns(size, positions):
+    """Return the constants columns of a unit flow leaving each unknown node position."""
+    columns = np.zeros((size, len(positions)))
+    columns[positions, np.arange(len(positions))] = -1.0
+    return columns
+
+def _connected_labels(size, ends_one, ends_two):
+    """Return the connected component of every item of a graph of size items with edges
+       between the given ends. Components are numbered in order of their first item.
+    """
+    if csgraph is not None:
+        graph = sparse.coo_matrix((np.ones(len(ends_one)), (ends_one, ends_two)),
+                                  shape=(size, size))
+        labels = csgraph.connected_components(graph, directed=False)[1]
+    else:
+        components = _DisjointSet()
+        for item_one, item_two in zip(ends_one.tolist(), ends_two.tolist()):
+            components.union(item_one, item_two)
+        labels = np.array([components.find(item) for item in range(size)], dtype=int)
+    _, firsts, labels = np.unique(labels, return_index=True, return_inverse=True)
+    numbers = np.empty(len(firsts), dtype=int)
+    numbers[np.argsort(firsts)] = np.arange(len(firsts))
+    return numbers[labels.reshape(-1)]
+
 class Simulator:
     """Engine to process conservative energy circuits.
        Could be registered Potential Sources, Transducers and Flow Maintainers or Flow Sources.
@@ -100,15 +1540,57 @@ class Simulator:
        All components registered must be fully connected between them.
     """
 
-    def __init__(self):
-        """Initialize values."""
+    def __init__(self, int_pins=False):
+        """Initialize values.
+           With int_pins the registered components get integer pins from a counter instead of
+           uuids, which are cheaper to hash and store in big circuits.
+        """
+        self._pin_type = int if int_pins else uuid.UUID
+        self._pin_counter = itertools.count()
         self._net_list = set()
+        # Integer id of every pin and the pin id pairs of the net list, flattened (None to
+        # number them again from the net list), so the node list is built with numpy.
+        self._pin_ids = dict()
+        self._net_ends = list()
         self.__node_list = list()
         self.__known_nodes = list()
         self.__unknown_nodes = list()
         self.__reference_node = 0
+        self.__reference_nodes = list()
+        self.__node_islands = None
         self.__ref = None
         self._components = dict()
+        self._table = _ComponentTable()
+        self._pin_components = dict()
+        self._pin_nets = dict()
+        self.__pin_ends = None
+        self.__pin_positions = np.empty(0, dtype=int)
+        self.__pin_nodes = np.empty(0, dtype=int)
+        self.__comp_nodes = np.empty((0, 2), dtype=int)
+        self.__topology = None
+        self.__factorization = None
+        self.__solutions = None
+        self.__newton = None
+        self.__ticks = 0
+        self.__sensor_models = dict()
+        self.__leak_models = dict()
+        self.__state_estimators = dict()
+        self.max_rank_updates = MAX_RANK_UPDATES
+        # Optional concurrent.futures executor solving the islands in parallel.
+        self.executor = None
+        # Series/parallel reduction of the transducers before solving.
+        self.reduce = False
+        self.__solver = None
+        self.cg_tolerance = CG_TOLERANCE
+        self.cg_preconditioner = CG_PRECONDITIONERS[0]
+        self.newton_tolerance = NEWTON_TOLERANCE
+        self.newton_max_iterations = NEWTON_MAX_ITERATIONS
+        self.jacobian_reuse_ratio = JACOBIAN_REUSE_RATIO
+        # Opt-in instrumentation: stats of the last simulate() and a callback receiving them.
+        self.profiling = False
+        self.stats_callback = None
+        self.stats = None
+        self.__stats = None
         self.logger = logging.getLogger()
 
     @property
@@ -119,17 +1601,28 @@ class Simulator:
     @reference.setter
     def reference(self, pin):
         """Reference pin."""
-        if not isinstance(pin, uuid.UUID):
-            raise TypeError(TYPE_ERROR_STR.substitute(value='pin', type='uuid.UUID'))
+        if not isinstance(pin, self._pin_type):
+            raise TypeError(TYPE_ERROR_STR.substitute(value='pin', type=self._pin_type.__name__))
 
-        pin_found = False
-        for net in self._net_list:
-            if pin in net:
-                pin_found = True
-
-        if not pin_found:
+        if not self._pin_nets.get(pin):
             raise AttributeError('Component pin not found to assign as reference point.')
         self.__ref = pin
+        self.__topology = None
+
+    @property
+    def solver(self):
+        """Name of the solver backend (one of SOLVERS), None to select it automatically."""
+        return self.__solver
+
+    @solver.setter
+    def solver(self, name):
+        """Name of the solver backend (one of SOLVERS), None to select it automatically."""
+        if name is not None and name not in SOLVERS:
+            raise AttributeError(f'Solver {name} not found, use one of {SOLVERS}.')
+        if name in (_SparseSolver.name, _ConjugateGradientSolver.name) and sparse is None:
+            raise AttributeError(f'Solver {name} requires scipy.')
+        self.__solver = name
+        self.__factorization = None
 
     @property
     def components(self):
@@ -142,6 +1635,12 @@ class Simulator:
         self.__known_nodes = list()
         self.__unknown_nodes = list()
         self.__reference_node = 0
+        self.__reference_nodes = list()
+        self.__node_islands = None
+        self.__pin_ends = None
+        self.__pin_positions = np.empty(0, dtype=int)
+        self.__pin_nodes = np.empty(0, dtype=int)
+        self.__comp_nodes = np.empty((0, 2), dtype=int)
         self.logger.debug('Variables Initialized!')
         self.logger.debug('\t %s %s %s %s', 
                           self.__node_list,
@@ -151,95 +1650,94 @@ class Simulator:
 
     def _find_component(self, pin):
         """Return a found component."""
-        for component in self._components.values():
-            if pin in (component.one, component.two):
-                return component
-        return None
+        return self._pin_components.get(pin)
 
     def _generate_node_list(self):
-        """Create the list of nodes."""
-        for net in self._net_list:
-            if len(self.__node_list) == 0:
-                self.__node_list.append([net[0], net[1]])
-            else:
-                found = False
-                for node in self.__node_list:
-                    if net[0] in node:
-                        node.append(net[1])
-                        found = True
-                        break
-                    if net[1] in node:
-                        node.append(net[0])
-                        found = True
-                        break
-                if not found:
-                    self.__node_list.append([net[0], net[1]])
-
-        for index, node in enumerate(self.__node_list):
-            self.logger.debug('NODE%s: %s', index, node)
+        """Create the list of nodes.
+           Connected pins are joined as the connected components of the net list. Nodes are
+           numbered in component registration order (pin one, then pin two) so the numbering
+           does not depend on the net list iteration order.
+        """
+        pin_count, self.__pin_positions, ends = self.__pin_ends
+        self.__pin_nodes = _connected_labels(pin_count + np.sum(self.__pin_positions >= pin_count),
+                                             ends[:, 0], ends[:, 1])
+        self.__comp_nodes = self.__pin_nodes[:pin_count].reshape(-1, 2)
+
+        self.__node_list = [list() for _ in range(self.__comp_nodes.max(initial=-1) + 1)]
+        for pin, node in zip(self._pin_components, self.__pin_nodes[:pin_count].tolist()):
+            self.__node_list[node].append(pin)
+
+        if self.logger.isEnabledFor(logging.DEBUG):
+            for index, node in enumerate(self.__node_list):
+                self.logger.debug('NODE%s: %s', index, node)
 
     #TODO Locate only connected components (Not components on air)
     def _generate_pre_sim_net_list(self):
         """NODE ALGORITHM STEP 1: Locate nets
-            Check all nodes and generate the components and node net list.
-        """
-        comp_net_list = list()
-        node_checked = list()
-        node_not_checked = [0]
-        while len(node_checked) != len(self.__node_list):
-            update_node_list = node_not_checked.copy()
-            for node in update_node_list:
-                for pin in self.__node_list[node]:
-                    target_comp = self._find_component(pin)
-                    node_one = _find_node(target_comp.one, self.__node_list)
-                    node_two = _find_node(target_comp.two, self.__node_list)
-                    target_node = node_one if node_one != node else node_two
-                    if target_node not in node_checked:
-                        comp_net_list.append([node, target_node, target_comp])
-                        if target_node not in node_not_checked:
-                            node_not_checked.append(target_node)
-                if node not in node_checked:
-                    node_checked.append(node)
-                node_not_checked.remove(node)
-
-        for index, net in enumerate(comp_net_list):
-            self.logger.debug('COMP_NET%s: %s', index, net)
-
-        return comp_net_list
+            Check all nodes and generate the pin one and pin two node arrays of the components,
+            in the components registration order.
+        """
+        comp_one, comp_two = self.__comp_nodes[:, 0], self.__comp_nodes[:, 1]
+
+        if self.logger.isEnabledFor(logging.DEBUG):
+            for index, net in enumerate(zip(comp_one.tolist(), comp_two.tolist(),
+                                            self._components.values())):
+                self.logger.debug('COMP_NET%s: %s', index, net)
+
+        return comp_one, comp_two
+
+    def _get_islands(self):
+        """NODE ALGORITHM STEP 1.1: Locate islands
+            Islands are the connected components of the nodes joined by the components,
+            numbered in node order.
+        """
+        self.__node_islands = _connected_labels(len(self.__node_list), self.__comp_nodes[:, 0],
+                                                self.__comp_nodes[:, 1])
+        self.logger.debug('ISLANDS: %s', self.__node_islands.max(initial=-1) + 1)
 
     def _get_reference_node(self):
         """NODE ALGORITHM STEP 2: Select a reference node
-            Extract reference node from list of nodes.
+            Extract reference node from list of nodes. Every other island gets its node with
+            more pins as reference.
         """
+        pin_counts = np.bincount(self.__comp_nodes.reshape(-1),
+                                 minlength=len(self.__node_list))
         if self.__ref is None:
-            max_len = max([len(node) for node in self.__node_list])
-            self.__reference_node = [index for index, node in enumerate(self.__node_list)
-                                     if max_len == len(node)][0]
+            self.__reference_node = int(np.argmax(pin_counts))
         else:
-            self.__reference_node = [index for index, node in enumerate(self.__node_list)
-                                     if self.__ref in node][0]
+            self.__reference_node = int(
+                self.__pin_nodes[self.__pin_positions[self._pin_ids[self.__ref]]])
             self.logger.debug('REFERENCE NODE %s %s',
                              'EVALUATED' if self.__ref is None else 'FORCED',
                              self.__reference_node)
 
-    def _get_known_nets(self, comp_net_list):
+        # The first node with more pins of every island, by island.
+        order = np.lexsort((-pin_counts, self.__node_islands))
+        islands, firsts = np.unique(self.__node_islands[order], return_index=True)
+        island_references = order[firsts]
+        island_references = island_references[
+            islands != self.__node_islands[self.__reference_node]]
+        self.__reference_nodes = [self.__reference_node] + sorted(island_references.tolist())
+
+    def _get_known_nets(self):
         """NODE ALGORITHM STEP 3.1: Extract the node algoritm known nets.
-            A known net is the net associated to a PowerSrc component.
+            A known net is the net associated to a PowerSrc component touching the reference
+            node of its island. The floating PowerSrc are solved with their flow as an unknown.
+            Returns the components of the known nets.
         """
-        known_nets = [net for net in comp_net_list
-                      if self.__reference_node in net and isinstance(net[2], PowerSrc)]
-        self.logger.debug('KNOWN NETS: %s', known_nets)
-        return known_nets
-
-    def _get_known_nodes(self, known_nets):
+        table = self._table
+        known = (table.kind[:table.size] == PowerSrc.KIND) & \
+            np.isin(self.__comp_nodes, self.__reference_nodes).any(axis=1)
+        known_comps = np.flatnonzero(known)
+        self.logger.debug('KNOWN NETS: %s', self.__comp_nodes[known_comps].tolist())
+        return known_comps
+
+    def _get_known_nodes(self, known_comps):
         """NODE ALGORITHM STEP 3.2: Extract the node algoritm known nodes.
            Identify the known nodes of the node algoritm.
         """
-        for net in known_nets:
-            if net[0] not in self.__known_nodes:
-                self.__known_nodes.append(net[0])
-            if net[1] not in self.__known_nodes:
-                self.__known_nodes.append(net[1])
+        nodes = self.__comp_nodes[known_comps].reshape(-1)
+        self.__known_nodes = nodes[np.sort(np.unique(nodes, return_index=True)[1])].tolist()
         self.logger.debug('KNOWN NODES: %s', self.__known_nodes)
 
     def _get_unknown_nodes(self):
@@ -248,173 +1746,381 @@ class Simulator:
 
            Extract from the self.__node_list all the nodes not present in self.__known_nodes.
         """
-        self.__unknown_nodes = [index for index, node in enumerate(self.__node_list)
-                                if index not in self.__known_nodes]
+        unknown = np.ones(len(self.__node_list), dtype=bool)
+        unknown[self.__known_nodes] = False
+        unknown[self.__reference_nodes] = False
+        self.__unknown_nodes = np.flatnonzero(unknown)
         self.logger.debug('UNKNOWN NODES: %s', self.__unknown_nodes)
 
-    def _find_target_net(self, comp_net_list, target_component):
-        """Find information of the node unknown to check."""
-        target_net = [net for net in comp_net_list if target_component in net][0]
-        self.logger.debug('\t COMPONENT NET: C_NET%s', target_net)
-
-        return target_net
-
-    def _extreme_known_value(self, known_nets, extreme_node):
-        """Calculate a node coeficient pair."""
-        extreme_net = [net for net in known_nets if extreme_node in (net[0], net[1])][0]
-        self.logger.debug('\t EXTREME NET: %s', extreme_net)
-        value_sign = 1.0 if extreme_net[2].one in self.__node_list[extreme_node] else -1.0
-        extreme_value = extreme_net[2].ddp*value_sign
-        self.logger.debug('\t EXTREME POWER VALUE: %s', extreme_value)
-        return extreme_value
-
-    def _nodes_checker(self, node, known_nets, comp_net_list):
-        result = 0.0
-        coeficients = list()
-        for pin in self.__node_list[node]:
-            self.logger.debug('-- CHECKING NODE%s: PIN=%s --', node, pin)
-            # Busqueda de nodo extremo
-            target_comp = self._find_component(pin)
-            self.logger.debug('\t TARGET COMPONENT: %s', target_comp)
-            target_net = self._find_target_net(comp_net_list, target_comp)
-
-            extreme_node = target_net[1] if target_net[0] == node else target_net[0]
-            self.logger.debug('\t EXTREME NODE: %s', extreme_node)
-
-            if isinstance(target_comp, Transducers):
-                self.logger.debug('\t COMPONENT TYPE: Transducers')
-                coeficients.append((node, 1.0/target_comp.res))
-
-                if extreme_node in self.__known_nodes:
-                    if extreme_node != self.__reference_node:
-                        raw_value = self._extreme_known_value(known_nets, extreme_node)
-                        result += raw_value/target_comp.res
-                else:
-                    raw_value = -1.0/target_comp.res
-                    coeficients.append((extreme_node, raw_value))
-
-            if isinstance(target_comp, FlowSrc):
-                self.logger.debug('\t COMPONENT TYPE: FlowSrc')
-                result += target_comp.cur if pin == target_comp.one else -target_comp.cur
-            self.logger.debug('\t CONSTANT VALUE: %s', result)
-            self.logger.debug('\t COEFICIENTS VALUES: %s', coeficients)
-
-        return result, coeficients
-
-    def _analize_node(self, node, known_nets, comp_net_list):
-        result, coeficients = self._nodes_checker(node, known_nets, comp_net_list)
-
-        full_coefs = list(range(len(self.__unknown_nodes)))
-        for index, u_node in enumerate(self.__unknown_nodes):
-            res_coef = 0.0
-            for coef in coeficients:
-                if coef[0] == u_node:
-                    res_coef += coef[1]
-            full_coefs[index] = res_coef
-        return (result, full_coefs.copy())
-
-    def _linear_solve_equations(self, equation_matrix):
-        """Solve linear matrix."""
-        contants_vector = np.array([el[0] for el in equation_matrix])
-        coeficients_vector = np.array([el[1] for el in equation_matrix])
-
-        solutions_vector = None
-        attempts = 10#MAX_ATTEMPTS
-        while attempts > 1:
-            try:
-                solutions_vector = list(np.linalg.solve(coeficients_vector, contants_vector))
-                attempts = 0
-            except np.linalg.LinAlgError as exception:
-                attempts -= 1
-                if attempts == 1:
-                    self.logger.error(exception)
-
+    def _select_solver(self, topology, size, nonzeros, initial=None):
+        """Return the solver backend of a system.
+           Acyclic circuits are swept, small or dense systems are solved dense, very big
+           symmetric positive definite ones (no floating PowerSrc) by conjugate gradient and
+           the rest with a sparse LU. A solver set by name is used whenever it applies.
+           initial is the previous solution of the system, the conjugate gradient start.
+        """
+        name = self.__solver
+        spd = len(topology.floating_index) == 0
+        if name == _TreeSweep.name and topology.tree is None:
+            self.logger.debug('Tree sweep does not apply, selecting the solver.')
+            name = None
+        if name == _ConjugateGradientSolver.name and not spd:
+            self.logger.debug('Conjugate gradient does not apply, selecting the solver.')
+            name = None
+        if name is None:
+            if topology.tree is not None and size == topology.size:
+                name = _TreeSweep.name
+            elif sparse is None or size < SPARSE_MIN_UNKNOWNS or \
+                    nonzeros >= DENSE_MIN_DENSITY*size*size:
+                name = _DenseSolver.name
+            elif spd and size >= CG_MIN_UNKNOWNS:
+                name = _ConjugateGradientSolver.name
+            else:
+                name = _SparseSolver.name
+
+        if name == _TreeSweep.name:
+            return topology.tree
+        if name == _ConjugateGradientSolver.name:
+            if self.cg_preconditioner not in CG_PRECONDITIONERS:
+                raise AttributeError(f'Preconditioner {self.cg_preconditioner} not found, '
+                                     f'use one of {CG_PRECONDITIONERS}.')
+            return _ConjugateGradientSolver(self.cg_tolerance, self.cg_preconditioner, initial)
+        return _SparseSolver() if name == _SparseSolver.name else _DenseSolver()
+
+    def _factorize(self, solver, rows, cols, values, size):
+        """Factorize the coefficients matrix with a solver backend and return its solve
+           function, or None when it is singular.
+        """
+        if self.__stats is not None:
+            self.__stats.count('nonzeros', len(values))
+        self.logger.debug('%s SOLVER: %s unknowns, %s entries', solver.name.upper(), size,
+                          len(values))
+        try:
+            return solver.factorize(rows, cols, values, size)
+        except np.linalg.LinAlgError as exception:
+            self.logger.error(exception)
+            return None
+
+    def _factorize_islands(self, topology, conductances):
+        """Factorize the coefficients matrix of every island for the branch conductances.
+           Returns the solve function of the whole system and the solver backends, or None
+           and None when the system is structurally singular or no island could be
+           factorized. Iterative solvers start from the last solution of the topology.
+           With an executor the islands are factorized and solved in parallel. A process pool
+           can not send the factorizations back, so it factorizes every island again on each
+           solve.
+        """
+        singularity = topology.singularity(conductances)
+        if singularity is not None:
+            self.logger.error('Singular node equations: %s', singularity)
+            return None, None
+        rows, cols, values = topology.coefficients(conductances)
+        initial = None
+        if self.__solutions is not None and self.__solutions[0] is topology:
+            initial = self.__solutions[1]
+
+        if len(topology.islands) <= 1 or \
+                (topology.tree is not None and self.__solver in (None, _TreeSweep.name)):
+            solver = self._select_solver(topology, topology.size, len(values), initial)
+            return self._factorize(solver, rows, cols, values, topology.size), [solver]
+
+        if self.__stats is not None:
+            self.__stats.count('islands', len(topology.islands))
+        local = topology.local_positions
+        systems = [(positions, local[rows[entries]], local[cols[entries]], values[entries])
+                   for positions, entries in topology.islands]
+        solvers = [self._select_solver(topology, len(positions), len(values),
+                                       None if initial is None else initial[positions])
+                   for positions, _, _, values in systems]
+        executor = self.executor
+
+        if isinstance(executor, ProcessPoolExecutor):
+            def solve(constants_vector):
+                solutions_vector = np.full(constants_vector.shape, np.nan)
+                futures = [executor.submit(_solve_system, solver, rows, cols, values,
+                                           len(positions), constants_vector[positions])
+                           for solver, (positions, rows, cols, values) in zip(solvers, systems)]
+                for (positions, *_), future in zip(systems, futures):
+                    try:
+                        solutions_vector[positions] = future.result()
+                    except np.linalg.LinAlgError as exception:
+                        self.logger.error(exception)
+                return solutions_vector
+            return solve, solvers
+
+        def factorize(island):
+            positions, rows, cols, values = systems[island]
+            return self._factorize(solvers[island], rows, cols, values, len(positions))
+        mapper = map if executor is None else executor.map
+        solves = list(mapper(factorize, range(len(systems))))
+        if all(island_solve is None for island_solve in solves):
+            return None, None
+
+        def solve(constants_vector):
+            solutions_vector = np.full(constants_vector.shape, np.nan)
+            def solve_island(island):
+                positions, island_solve = systems[island][0], solves[island]
+                if island_solve is not None:
+                    solutions_vector[positions] = island_solve(constants_vector[positions])
+            list(mapper(solve_island, range(len(systems))))
+            return solutions_vector
+        return solve, solvers
+
+    def _linear_solve_equations(self, topology, conductances, constants_vector):
+        """Solve linear matrix.
+           The factorization is kept while the coefficients do not change, so a change in the
+           source values only costs a new substitution of the constants vector. Up to
+           max_rank_updates transducers may change their resistance before factorizing again.
+           The solution is kept as the start of the iterative solvers on the next tick.
+        """
+        stats = self.__stats
+        factorization = self.__factorization
+        if factorization is not None and factorization.topology is topology:
+            changed = factorization.changed(conductances)
+            # A transducer closing (no conductance) may isolate nodes: only a factorization
+            # checks the singularity of the node equations.
+            if (len(changed) <= self.max_rank_updates
+                    and np.all(np.isfinite(conductances[changed]))
+                    and np.all(conductances[changed] != 0.0)):
+                iterations = factorization.iterations
+                try:
+                    solutions_vector = factorization.solve(conductances, constants_vector,
+                                                           changed)
+                    if stats is not None:
+                        stats.solver = factorization.solver
+                        stats.count('rank_updates', len(changed))
+                        self._count_iterations(factorization, iterations)
+                        stats.lap('solve')
+                    self.logger.debug('MATRIX SOLUTIONS: %s', solutions_vector)
+                    self.__solutions = (topology, solutions_vector)
+                    return solutions_vector
+                except np.linalg.LinAlgError as exception:
+                    self.logger.debug('Low-rank update failed: %s', exception)
+
+        solve, solvers = self._factorize_islands(topology, conductances)
+        if stats is not None:
+            stats.solver = None if solvers is None else _solver_names(solvers)
+            stats.count('factorizations')
+            stats.lap('factorization')
+        if solve is None:
+            self.__factorization = None
+            return None
+        factorization = self.__factorization = _Factorization(topology, conductances, solve,
+                                                              solvers)
+
+        try:
+            solutions_vector = solve(constants_vector)
+        except np.linalg.LinAlgError as exception:
+            self.logger.error(exception)
+            return None
+        if stats is not None:
+            self._count_iterations(factorization, 0)
+            stats.lap('solve')
         self.logger.debug('MATRIX SOLUTIONS: %s', solutions_vector)
+        self.__solutions = (topology, solutions_vector)
         return solutions_vector
 
-    def _solve_linear_unknown_powers(self, node_powers_vector, known_nets, comp_net_list):
-        unknown_equation_matrix = list()
-        for node in self.__unknown_nodes:
-            # Por cada pin en el nodo:
-            node_equation = self._analize_node(node, known_nets, comp_net_list)
-            unknown_equation_matrix.append(node_equation)
-            self.logger.debug('\t MATRIX UPDATE: %s', unknown_equation_matrix)
-        self.logger.debug('FINAL MATRIX: %s', unknown_equation_matrix)
-        unknown_solutions = self._linear_solve_equations(unknown_equation_matrix)
+    def _count_iterations(self, factorization, iterations):
+        """Count the conjugate gradient iterations of a factorization since it had the given
+           ones, when it has iterative solvers.
+        """
+        if factorization.iterations is not None:
+            self.__stats.count('iterations', factorization.iterations - iterations)
 
-        for index, node in enumerate(self.__unknown_nodes):
-            node_powers_vector[node] = unknown_solutions[index]
+    def _solve_linear_unknown_powers(self, topology, node_powers_vector, conductances=None,
+                                     transducer_currents=None):
+        """Solve the unknown node powers in place and return the floating PowerSrc flows.
+           The transducer conductances are read from the components when not given.
+        """
+        if conductances is None:
+            conductances = topology.conductances()
+        branch_conductances = topology.branch_conductances(conductances)
+        constants_vector = topology.constants(node_powers_vector, branch_conductances,
+                                              transducer_currents=transducer_currents)
+        if self.__stats is not None:
+            self.__stats.lap('assembly')
+        solutions_vector = self._linear_solve_equations(topology, branch_conductances,
+                                                        constants_vector)
+        if solutions_vector is None:
+            solutions_vector = np.full(topology.size, np.nan)
+        unknown_solutions, source_flows = topology.split(solutions_vector)
+        node_powers_vector[topology.unknown_nodes] = unknown_solutions
+        topology.expand(node_powers_vector, conductances)
 
         self.logger.debug('POWER SOLUTIONS: %s', node_powers_vector)
-
-    #TODO: Known Node Error
-    def _solve_known_powers(self, node_powers_vector, known_nets):
-        for net in known_nets:
-            node = net[1] if self.__reference_node == net[0] else net[0]
-            value = net[2].ddp if net[2].one in self.__node_list[node] else -net[2].ddp
-            node_powers_vector[node] = value
+        return source_flows
+
+    def _solve_nonlinear_unknown_powers(self, topology, node_powers_vector):
+        """Solve the unknown node powers of a circuit with pipes in place by damped Newton
+           iterations and return the floating PowerSrc flows.
+           Every iteration solves the node equations of the circuit linearized at the last
+           solution: each transducer is its flow slope (the Jacobian conductance) plus the
+           rest of its flow as a current. The Jacobian, and so its factorization, is kept over
+           iterations and ticks while every step shrinks at least jacobian_reuse_ratio times
+           the previous one and the ticks converge within NEWTON_REUSE_ITERATIONS. A tick
+           starts from the solution of the last one, and a step is halved while it does not
+           reduce the flow imbalance of the nodes.
+        """
+        stats = self.__stats
+        conductances = topology.conductances()
+        state = self.__newton
+        if state is not None and state[0] is topology:
+            _, solutions_vector, jacobian = state
+        else:
+            jacobian = None
+            solutions_vector = self._linear_solve_equations(
+                topology, conductances, topology.constants(node_powers_vector, conductances))
+        if solutions_vector is None:
+            solutions_vector = np.full(topology.size, np.nan)
+
+        def imbalance(solutions_vector):
+            unknown_solutions, source_flows = topology.split(solutions_vector)
+            node_powers_vector[topology.unknown_nodes] = unknown_solutions
+            return np.linalg.norm(topology.imbalance(node_powers_vector, conductances,
+                                                     source_flows))
+
+        residual, previous_step, converged = imbalance(solutions_vector), None, False
+        for iteration in range(self.newton_max_iterations):
+            if not np.isfinite(residual):
+                break
+            heads = topology.branch_powers(node_powers_vector)[topology.transducer_index]
+            if jacobian is None:
+                jacobian = topology.flow_slopes(heads, conductances)
+                if stats is not None:
+                    stats.count('jacobians')
+            currents = topology.transducer_flows(heads, conductances) - jacobian*heads
+            linear_solution = self._linear_solve_equations(
+                topology, jacobian,
+                topology.constants(node_powers_vector, jacobian, transducer_currents=currents))
+            if linear_solution is None:
+                break
+            step = linear_solution - solutions_vector
+
+            damping = 1.0
+            while True:
+                trial_residual = imbalance(solutions_vector + damping*step)
+                if trial_residual <= (1.0 - 1e-4*damping)*residual or damping < 1e-3:
+                    break
+                damping /= 2
+            solutions_vector = solutions_vector + damping*step
+            residual = trial_residual
+            step_size = damping*np.max(np.abs(step), initial=0.0)
+            if stats is not None:
+                stats.count('newton_iterations')
+            if step_size <= self.newton_tolerance*max(1.0, np.max(np.abs(solutions_vector))):
+                converged = True
+                break
+            if damping < 1.0 or (previous_step is not None and
+                                 step_size > self.jacobian_reuse_ratio*previous_step):
+                jacobian = None
+            previous_step = step_size
+
+        imbalance(solutions_vector)
+        if not converged:
+            self.logger.error('Newton iterations did not converge (residual %s).', residual)
+            self.__newton = None
+            return topology.split(solutions_vector)[1]
+        if iteration >= NEWTON_REUSE_ITERATIONS:
+            # Slow ticks take the Jacobian again at their solution for the next one.
+            jacobian = None
+        self.__newton = (topology, solutions_vector, jacobian)
         self.logger.debug('POWER SOLUTIONS: %s', node_powers_vector)
+        return topology.split(solutions_vector)[1]
 
-    def _update_component_values(self, comp_net_list, node_powers_vector):
-        for net in comp_net_list:
-            net_order = 1.0 if net[2].one in self.__node_list[net[0]] else -1.0
-            net_ddp = (node_powers_vector[net[0]] - node_powers_vector[net[1]])*net_order
-
-            if isinstance(net[2], Transducers):
-                net[2].ddp = net_ddp
-                net[2].cur = net_ddp / net[2].res
-            elif isinstance(net[2], FlowSrc):
-                net[2].ddp = net_ddp
-                net[2].res = float('inf')
-            else:
-                net[2].res = 0.0
-
-        for sim_net in comp_net_list:
-            if isinstance(sim_net[2], PowerSrc):
-                check_node = sim_net[0] if sim_net[0] != self.__reference_node else sim_net[1]
-                calc_cur = 0.0
-                for pin in self.__node_list[check_node]:
-                    check_comp = self._find_component(pin)
-                    if not isinstance(check_comp, PowerSrc):
-                        comp_cur = [search_net[2].cur for search_net in comp_net_list
-                                    if check_comp == search_net[2]][0]
-                        cur_sign = 1.0 if check_comp.two in self.__node_list[check_node] else -1.0
-                        calc_cur += comp_cur * cur_sign
-                sim_net[2].cur = calc_cur
+    def _update_component_values(self, topology, node_powers_vector, write_back=True,
+                                 source_flows=None, conductances=None,
+                                 transducer_currents=None):
+        """Return the component ddp, res and cur arrays of the simulation, written in the
+           component table too when write_back is set.
+        """
+        table = self._table
+        ddp = table.ddp[:table.size].copy()
+        res = table.res[:table.size].copy()
+        cur = table.cur[:table.size].copy()
+        if conductances is None:
+            conductances = topology.conductances()
+        net_ddp = topology.branch_powers(node_powers_vector)
+        flows = topology.flows(node_powers_vector, conductances, cur[topology.flow_index],
+                               source_flows, transducer_currents)
+
+        ddp[topology.transducer_index] = net_ddp[topology.transducer_index]
+        cur[topology.transducer_index] = flows[topology.transducer_index]
+        ddp[topology.flow_index] = net_ddp[topology.flow_index]
+        res[topology.flow_index] = float('inf')
+        res[topology.power_index] = 0.0
+        cur[topology.power_index] = flows[topology.power_index]
+
+        if write_back:
+            table.ddp[:table.size] = ddp
+            table.res[:table.size] = res
+            table.cur[:table.size] = cur
+        return ddp, res, cur
 
     def _check_net_list(self):
-        """Check unconnected components in the list."""
-        for c_name, c_comp in self._components.copy().items():
-            found_pin_one = False
-            for conn_tuple in self._net_list:
-                if c_comp.one in conn_tuple:
-                    found_pin_one = True
-
-            found_pin_two = False
-            for conn_tuple in self._net_list:
-                if c_comp.two in conn_tuple:
-                    found_pin_two = True
+        """Check unconnected components in the list.
+           Numbers the pins of the components in registration order (pin one, then pin two)
+           and the net list ends with them, for the node list.
+        """
+        if self._net_ends is None:
+            self._net_ends = [self._pin_ids[pin]
+                              for pin in itertools.chain.from_iterable(self._net_list)]
+        table = self._table
+        pin_ids = np.column_stack((table.pin_one[:table.size],
+                                   table.pin_two[:table.size])).reshape(-1)
+        ends = np.fromiter(self._net_ends, dtype=int, count=len(self._net_ends))
+        # Pins of no registered component take the positions after the component pins.
+        positions = np.full(len(self._pin_ids), -1)
+        positions[pin_ids] = np.arange(len(pin_ids))
+        foreign = np.unique(ends[positions[ends] < 0])
+        positions[foreign] = len(pin_ids) + np.arange(len(foreign))
+        ends = positions[ends]
+        self.__pin_ends = (len(pin_ids), positions, ends.reshape(-1, 2))
+
+        found_pins = np.bincount(ends, minlength=len(pin_ids) + len(foreign))[
+            :len(pin_ids)].reshape(-1, 2) > 0
+        unconnected = np.flatnonzero(~np.all(found_pins, axis=1)).tolist()
+        names = list(self._components) if unconnected else None
+        for index in unconnected:
+            c_name = names[index]
+            c_comp = self._components[c_name]
+            found_pin_one, found_pin_two = found_pins[index]
 
             if not found_pin_one and not found_pin_two:
                 self._components.pop(c_name)
+                self._table.remove(c_comp._row)
+                self._pin_components.pop(c_comp.one)
+                self._pin_components.pop(c_comp.two)
                 self.logger.info('Removed unused component %s.', c_name)
             elif not found_pin_one:
                 raise AttributeError(f'Component {c_name} pin one on the air.')
             elif not found_pin_two:
                 raise AttributeError(f'Component {c_name} pin one on the air.')
+        if unconnected:
+            self._check_net_list()
 
     def connect(self, node_l, node_r):
         """Connect Elements."""
-        if not isinstance(node_r, uuid.UUID):
+        if not isinstance(node_r, self._pin_type):
             self.logger.debug(type(node_l))
-            raise TypeError(TYPE_ERROR_STR.safe_substitute(value='node_r', type='uuid.UUID'))
+            raise TypeError(TYPE_ERROR_STR.safe_substitute(value='node_r',
+                                                           type=self._pin_type.__name__))
 
-        if not isinstance(node_l, uuid.UUID):
+        if not isinstance(node_l, self._pin_type):
             self.logger.debug(type(node_l))
-            raise TypeError(TYPE_ERROR_STR.safe_substitute(value='node_l', type='uuid.UUID'))
+            raise TypeError(TYPE_ERROR_STR.safe_substitute(value='node_l',
+                                                           type=self._pin_type.__name__))
 
-        if node_l != node_r and (node_r, node_l) not in self._net_list:
+        if node_l != node_r and (node_r, node_l) not in self._net_list \
+                and (node_l, node_r) not in self._net_list:
             self._net_list.add((node_l, node_r))
+            if self._net_ends is not None:
+                pin_ids = self._pin_ids
+                self._net_ends.extend((pin_ids.setdefault(node_l, len(pin_ids)),
+                                       pin_ids.setdefault(node_r, len(pin_ids))))
+            # Pins have a few nets, lists are lighter than sets.
+            self._pin_nets.setdefault(node_l, list()).append((node_l, node_r))
+            self._pin_nets.setdefault(node_r, list()).append((node_l, node_r))
+            self.__topology = None
 
     def print_components_info(self):
         """Display information of the components to simulate."""
@@ -427,31 +2133,720 @@ class Simulator:
             self.logger.debug(str_out)
         self.logger.debug('-'*55)
 
-    def simulate(self):
-        """Simulate the components properly connected."""
-        if len(self._components) <= 2:
-            raise AttributeError('Add some components to the list.')
+    def _lap(self, phase):
+        """Charge the time since the previous lap to a phase when profiling."""
+        if self.__stats is not None:
+            self.__stats.lap(phase)
 
-        self._check_net_list()
+    def _compile_topology(self, reduce=None):
+        """Run the node algorithm steps that only depend on the circuit topology.
+           The transducers are reduced following the reduce attribute unless given.
+        """
         self._initialize_vectors()
+        self._check_net_list()
+        self._lap('check_net_list')
         self._generate_node_list()
-        comp_net_list = self._generate_pre_sim_net_list()
+        self._lap('node_list')
+        comp_nodes = self._generate_pre_sim_net_list()
+        self._lap('net_list')
+        self._get_islands()
         self._get_reference_node()
 
-        known_nets = self._get_known_nets(comp_net_list)
-        self._get_known_nodes(known_nets)
+        self._get_known_nodes(self._get_known_nets())
         self._get_unknown_nodes()
+        self._lap('partition')
+
+        topology = _Topology(self._table, list(self._components), self.__node_list, comp_nodes,
+                             self.__reference_nodes, self.__node_islands, self.__unknown_nodes,
+                             self.reduce if reduce is None else reduce)
+        self._lap('incidence')
+        if self.__stats is not None:
+            self.__stats.count('topology_compiles')
+        return topology
+
+    @property
+    def topology(self):
+        """Compiled topology, generated again only after a topology or reference change."""
+        if self.__topology is None or self.__topology.reduce != self.reduce:
+            self.__topology = self._compile_topology()
+        return self.__topology
+
+    def simulate(self, write_back=True):
+        """Simulate the components properly connected.
+           Returns an immutable SimulationResult. The results are also written in the
+           components unless write_back is False.
+        """
+        if len(self._components) <= 2:
+            raise AttributeError('Add some components to the list.')
 
-        # Solve Unknown Nodes
-        node_powers_vector = list(range(len(self.__node_list)))
-        node_powers_vector[self.__reference_node] = 0.0
-        if len(self.__unknown_nodes) > 0:
-            self._solve_linear_unknown_powers(node_powers_vector, known_nets, comp_net_list)
+        stats = self.__stats = SimulationStats() if self.profiling else None
+        try:
+            topology = self.topology
+            node_powers_vector = topology.known_powers()
+            self.logger.debug('POWER SOLUTIONS: %s', node_powers_vector)
+            self._lap('assembly')
+
+            # Solve Unknown Nodes
+            source_flows = None
+            if topology.size > 0 and len(topology.pipe_positions) > 0:
+                source_flows = self._solve_nonlinear_unknown_powers(topology,
+                                                                    node_powers_vector)
+            elif topology.size > 0:
+                source_flows = self._solve_linear_unknown_powers(topology, node_powers_vector)
+            else:
+                topology.expand(node_powers_vector, topology.conductances())
+
+            ddp, res, cur = self._update_component_values(topology, node_powers_vector,
+                                                          write_back, source_flows)
+            self._lap('update')
+            if write_back and self.logger.isEnabledFor(logging.DEBUG):
+                self.print_components_info()
+        finally:
+            self.__stats = None
+
+        self.__ticks += 1
+        result = SimulationResult(self.__ticks, topology.names, ddp, res, cur,
+                                  node_powers_vector)
+        if stats is not None:
+            self._publish_stats(stats, topology)
+        return result
+
+    def _publish_stats(self, stats, topology):
+        """Count the circuit sizes in the stats of a tick and hand them over."""
+        stats.count('components', len(topology.names))
+        stats.count('nodes', len(topology.node_list))
+        stats.count('unknowns', topology.size)
+        self.stats = stats
+        if self.stats_callback is not None:
+            self.stats_callback(stats)
+
+    def simulate_transient(self, dt, steps, method=TRANSIENT_METHODS[0], write_back=True):
+        """Simulate the circuit over time with its tanks and inertias, for steps of dt
+           seconds, integrated with one of TRANSIENT_METHODS.
+           Starts from the component values, as a simulate() leaves them: the ddp (level) of
+           the tanks and the cur of the inertias. Returns a generator yielding the
+           SimulationResult of every step as it is solved, also written in the components
+           unless write_back is False. The source values and resistances are read on every
+           step, so they can change between steps. At a fixed dt the companion models of
+           the tanks and inertias keep their conductances, so the node equations are
+           factorized once for all the steps. The first step of the trapezoidal rule is taken
+           as two backward Euler half steps, which do not need the starting tank flows and
+           inertia ddp.
+        """
+        if len(self._components) <= 2:
+            raise AttributeError('Add some components to the list.')
+        if not dt > 0:
+            raise AttributeError('The time step must be positive.')
+        if method not in TRANSIENT_METHODS:
+            raise AttributeError(f'Method {method} not found, use one of {TRANSIENT_METHODS}.')
+        topology = self.topology
+        if len(topology.pipe_positions) > 0:
+            raise AttributeError('Transient simulation requires a circuit without pipes.')
+        return self._transient_steps(topology, _Integrator(topology, dt, method), steps,
+                                     write_back)
+
+    def _transient_steps(self, topology, integrator, steps, write_back):
+        """Yield the SimulationResult of the steps of a transient simulation."""
+        table = self._table
+        ddp = np.nan_to_num(table.ddp[:table.size], posinf=0.0, neginf=0.0)
+        cur = np.nan_to_num(table.cur[:table.size], posinf=0.0, neginf=0.0)
+        substeps = [integrator]
+        if integrator.trapezoidal:
+            # Two backward Euler half steps have the conductances of a trapezoidal step.
+            start = _Integrator(topology, integrator.dt/2, TRANSIENT_METHODS[1])
+            substeps = [start, start]
+        for _ in range(steps):
+            stats = self.__stats = SimulationStats() if self.profiling else None
+            try:
+                for substep in substeps:
+                    node_powers_vector, ddp, res, cur = self._transient_step(
+                        topology, substep, ddp, cur, write_back)
+            finally:
+                self.__stats = None
+            substeps = [integrator]
+
+            self.__ticks += 1
+            result = SimulationResult(self.__ticks, topology.names, ddp, res, cur,
+                                      node_powers_vector)
+            if stats is not None:
+                self._publish_stats(stats, topology)
+            yield result
+
+    def _transient_step(self, topology, integrator, ddp, cur, write_back):
+        """Solve a step of a transient simulation from the component ddp and cur of the
+           previous one. Returns the node powers and the component ddp, res and cur.
+        """
+        conductances = topology.conductances()
+        step_conductances = integrator.conductances(conductances)
+        currents = integrator.currents(conductances, step_conductances, ddp, cur)
+        node_powers_vector = topology.known_powers()
+        self._lap('assembly')
+
+        source_flows = None
+        if topology.size > 0:
+            source_flows = self._solve_linear_unknown_powers(
+                topology, node_powers_vector, step_conductances, currents)
+        ddp, res, cur = self._update_component_values(
+            topology, node_powers_vector, write_back, source_flows, step_conductances,
+            currents)
+        self._lap('update')
+        return node_powers_vector, ddp, res, cur
+
+    def simulate_batch(self, parameter_matrix):
+        """Simulate many parameter sets over the current topology.
+           parameter_matrix is an (n_scenarios x n_components) array with one value per
+           component, in the components order: ddp for PowerSrc, res for Transducers and cur
+           for FlowSrc. The registered components are not modified.
+
+           Returns the (n_scenarios x n_nodes) node powers, in the topology node order, and
+           the (n_scenarios x n_components) component flows. Circuits with pipes are not
+           linear, so they can not be simulated in batch.
+        """
+        topology = self.topology
+        if len(topology.pipe_positions) > 0:
+            raise AttributeError('Batch simulation requires a circuit without pipes.')
+        parameter_matrix = np.atleast_2d(np.array(parameter_matrix, dtype=float))
+        if parameter_matrix.ndim != 2 or parameter_matrix.shape[1] != len(topology.names):
+            raise AttributeError('One parameter per component is required for each scenario.')
+
+        conductances = 1.0/parameter_matrix[:, topology.transducer_index]
+        currents = parameter_matrix[:, topology.flow_index]
+        node_powers = topology.known_powers(parameter_matrix)
+        branch_conductances = topology.branch_conductances(conductances)
+        source_flows = None
+        if topology.size > 0:
+            constants_matrix = topology.constants(node_powers, branch_conductances, currents,
+                                                  parameter_matrix)
+            node_powers[:, topology.unknown_nodes], source_flows = topology.split(
+                self._batch_solve(topology, branch_conductances, constants_matrix))
+        topology.expand(node_powers, conductances)
+
+        return node_powers, topology.flows(node_powers, conductances, currents, source_flows)
+
+    def _inputs(self, topology):
+        """Return the inputs of the sensor models: PowerSrc ddp then FlowSrc cur."""
+        table = self._table
+        return np.concatenate((table.ddp[topology.power_index], table.cur[topology.flow_index]))
+
+    def _sensor_model(self, topology, conductances, names):
+        """Build the sensor model of the named components solving one scenario per input."""
+        try:
+            meters = [topology.names[name] for name in names]
+        except KeyError as exception:
+            raise AttributeError(f'Component {exception.args[0]} not found.') from None
+        inputs_index = np.concatenate((topology.power_index, topology.flow_index))
+        parameter_matrix = np.zeros((len(inputs_index), len(topology.names)))
+        parameter_matrix[:, topology.transducer_index] = 1.0/conductances
+        parameter_matrix[np.arange(len(inputs_index)), inputs_index] = 1.0
+        _, flows = self.simulate_batch(parameter_matrix)
+        return _SensorModel(topology, conductances, meters, flows[:, meters].T)
+
+    def metered_flows(self, names):
+        """Return the flows of the named components for the current component values.
+           The linear map from the source values to these flows is kept, so while the
+           topology and resistances do not change every call is a small matrix-vector
+           product. The map is computed again after any of them changes. The components are
+           not modified.
+        """
+        names = tuple(names)
+        topology = self.topology
+        conductances = topology.conductances()
+        model = self.__sensor_models.get(names)
+        if model is None or not model.valid(topology, conductances):
+            model = self.__sensor_models[names] = self._sensor_model(topology, conductances,
+                                                                     names)
+        return model.flows(self._inputs(topology))
+
+    def _batch_solve(self, topology, conductances, constants_matrix):
+        """Solve the node equations of every scenario.
+           Scenarios sharing their conductances share one factorization and are solved as a
+           stacked constants matrix. Small systems with different conductances are solved with
+           batched dense solves.
+        """
+        scenarios, size = constants_matrix.shape
+        unique, groups = np.unique(conductances, axis=0, return_inverse=True)
+        groups = groups.reshape(-1)
+        solutions = np.full((scenarios, size), np.nan)
+
+        if len(unique) > 1 and (sparse is None or size < SPARSE_MIN_UNKNOWNS):
+            rows, cols, values = topology.coefficients(conductances)
+            # Chunks of at most 2**24 matrix entries.
+            step = max(1, 2**24 // (size*size))
+            for start in range(0, scenarios, step):
+                chunk = slice(start, min(start + step, scenarios))
+                matrices = np.zeros((chunk.stop - chunk.start, size, size))
+                np.add.at(matrices, (np.arange(chunk.stop - chunk.start)[:, None], rows, cols),
+                          values[chunk])
+                try:
+                    solutions[chunk] = np.linalg.solve(matrices,
+                                                       constants_matrix[chunk][..., None])[..., 0]
+                except np.linalg.LinAlgError:
+                    # Only the singular scenarios of the chunk are left unsolved.
+                    for scenario, matrix in zip(range(chunk.start, chunk.stop), matrices):
+                        try:
+                            solutions[scenario] = np.linalg.solve(matrix,
+                                                                  constants_matrix[scenario])
+                        except np.linalg.LinAlgError as exception:
+                            self.logger.error('%s in scenario %s.', exception, scenario)
+            return solutions
+
+        for group, group_conductances in enumerate(unique):
+            members = np.flatnonzero(groups == group)
+            solve = self._base_solve(topology, group_conductances)
+            if solve is None:
+                continue
+            try:
+                solutions[members] = solve(constants_matrix[members].T).T
+            except np.linalg.LinAlgError as exception:
+                self.logger.error(exception)
+        return solutions
 
-        self._solve_known_powers(node_powers_vector, known_nets)
+    def _base_solve(self, topology, conductances):
+        """Return the solve function of the node equations for the branch conductances: the
+           kept factorization when it is of them, a new one otherwise (None if singular).
+        """
+        factorization = self.__factorization
+        if (factorization is not None and factorization.topology is topology
+                and np.array_equal(factorization.conductances, conductances)):
+            return factorization.solve_base
+        return self._factorize_islands(topology, conductances)[0]
+
+    def _solve_columns(self, topology, conductances, solve, columns):
+        """Return the solutions of the node equations for an iterable of constants matrices,
+           fanned out over the executor, if any. A process pool factorizes the equations
+           once per matrix.
+        """
+        executor = self.executor
+        if isinstance(executor, ProcessPoolExecutor):
+            rows, cols, values = topology.coefficients(conductances)
+            solver = self._select_solver(topology, topology.size, len(values))
+            return executor.map(_solve_system, itertools.repeat(solver), itertools.repeat(rows),
+                                itertools.repeat(cols), itertools.repeat(values),
+                                itertools.repeat(topology.size), columns)
+        return (map if executor is None else executor.map)(solve, columns)
+
+    def contingency_scan(self, meters, segments=None):
+        """Return the (segments x meters) matrix of the changes of the metered flows when
+           each segment is closed, for the current component values.
+           meters are component names and segments Transducers names, all of them in the
+           components order by default. The components are not modified.
+
+           The circuit is factorized once: closing a segment only changes the conductance of
+           its branch, a rank-1 downdate (Sherman-Morrison) of the base equations. Every
+           outage costs one solve with its incidence column, batched in chunks and fanned out
+           over the executor, if any. A process pool factorizes the equations once per chunk.
+        """
+        topology = self.topology
+        if len(topology.pipe_positions) > 0:
+            raise AttributeError('Contingency scan requires a circuit without pipes.')
+        names = list(topology.names)
+        if segments is None:
+            segments = [names[index] for index in topology.transducer_index]
+        try:
+            meters = np.array([topology.names[name] for name in meters], dtype=int)
+            segments = np.array([topology.names[name] for name in segments], dtype=int)
+        except KeyError as exception:
+            raise AttributeError(f'Component {exception.args[0]} not found.') from None
+        transducer_position = np.full(len(names), -1)
+        transducer_position[topology.transducer_index] = np.arange(
+            len(topology.transducer_index))
+        outages = transducer_position[segments]
+        if np.any(outages < 0):
+            raise AttributeError('Only Transducers segments can be closed.')
+
+        conductances = topology.conductances()
+        branch_conductances = topology.branch_conductances(conductances)
+        currents = self._table.cur[topology.flow_index]
+        node_powers_vector = topology.known_powers()
+        if topology.size == 0:
+            # No node equations: every head is known, the base state and the closed
+            # segments only differ by the flows given those heads.
+            closed = np.tile(conductances, (len(outages) + 1, 1))
+            closed[np.arange(1, len(outages) + 1), outages] = 0.0
+            powers = np.tile(node_powers_vector, (len(outages) + 1, 1))
+            topology.expand(powers, closed)
+            flows = topology.flows(powers, closed, np.tile(currents, (len(outages) + 1, 1)),
+                                   topology.split(np.zeros((len(outages) + 1, 0)))[1])
+            return flows[1:, meters] - flows[0, meters]
+        deltas = np.zeros((len(outages), len(meters)))
+        solve = self._base_solve(topology, branch_conductances)
+        if solve is None:
+            return np.full((len(outages), len(meters)), np.nan)
+        solutions_vector = solve(topology.constants(node_powers_vector, branch_conductances))
+        node_powers_vector[topology.unknown_nodes] = topology.split(solutions_vector)[0]
+        topology.expand(node_powers_vector, conductances)
+        base_flows = topology.flows(node_powers_vector, conductances, currents,
+                                    topology.split(solutions_vector)[1])
+
+        # Branch of every outage, its conductance decrement and its ddp in the base state.
+        branches = outages
+        if topology.reduction is not None:
+            reduction = topology.reduction
+            branches = reduction.parallel_index[reduction.series_index[outages]]
+        # Chunks of at most 2**22 entries per outage matrix.
+        step = max(1, 2**22 // max(topology.size, len(conductances), len(names)))
+        chunks = [np.arange(start, min(start + step, len(outages)))
+                  for start in range(0, len(outages), step)]
+        columns = (topology.incidence_columns(branches[chunk]) for chunk in chunks)
+
+        solved = self._solve_columns(topology, branch_conductances, solve, columns)
+
+        b_one, b_two = topology.branch_ends
+        p_one, p_two = topology.transducer_positions
+        if topology.reduction is None:
+            # Only the metered flows are needed: sums of transducer and floating PowerSrc
+            # flows, linear in the solution but for the closed segment, which stops.
+            transducer_terms, source_terms = topology.meter_terms(meters)
+            term_rows, term_positions, term_signs = transducer_terms
+            base_transducer_flows = base_flows[topology.transducer_index]
+        for chunk, base_columns in zip(chunks, solved):
+            chunk_branches = branches[chunk]
+            if topology.reduction is None:
+                decrements = -conductances[outages[chunk]]
+            else:
+                closed = np.tile(conductances, (len(chunk), 1))
+                closed[np.arange(len(chunk)), outages[chunk]] = 0.0
+                decrements = topology.branch_conductances(closed)[
+                    np.arange(len(chunk)), chunk_branches] - branch_conductances[chunk_branches]
+            heads = node_powers_vector[b_one[chunk_branches]] - \
+                node_powers_vector[b_two[chunk_branches]]
+            padded = np.vstack((base_columns, np.zeros((1, len(chunk)))))
+            projections = padded[p_one[chunk_branches], np.arange(len(chunk))] - \
+                padded[p_two[chunk_branches], np.arange(len(chunk))]
+            denominators = 1.0 + decrements*projections
+            # A closed segment isolating part of the circuit only changes its flows when
+            # the segment carried flow: then the equations are singular.
+            isolating = np.abs(denominators) < 1e-10
+            scales = np.divide(-decrements*heads, denominators,
+                               out=np.zeros(len(chunk)), where=~isolating)
+            singular = isolating & (np.abs(decrements*heads) > 1e-10)
+            if np.any(singular):
+                self.logger.error('Singular node equations closing %s.',
+                                  [names[segment] for segment in segments[chunk[singular]]])
+            padded *= scales
+
+            if topology.reduction is None:
+                changes = conductances[term_positions][:, None]*(
+                    padded[p_one[term_positions]] - padded[p_two[term_positions]])
+                changes = np.where(term_positions[:, None] == outages[chunk],
+                                   -base_transducer_flows[term_positions][:, None], changes)
+                source_rows, source_positions, source_signs = source_terms
+                deltas[chunk] = _scatter_add(term_rows, term_signs*changes.T, len(meters)) + \
+                    _scatter_add(source_rows, source_signs*padded[source_positions].T,
+                                 len(meters))
+            else:
+                outage_solutions = solutions_vector + padded[:-1].T
+                outage_powers = np.tile(node_powers_vector, (len(chunk), 1))
+                unknown_solutions, source_flows = topology.split(outage_solutions)
+                outage_powers[:, topology.unknown_nodes] = unknown_solutions
+                topology.expand(outage_powers, closed)
+                flows = topology.flows(outage_powers, closed,
+                                       np.tile(currents, (len(chunk), 1)), source_flows)
+                deltas[chunk] = flows[:, meters] - base_flows[meters]
+            deltas[chunk[singular]] = np.nan
+        return deltas
+
+    def _leak_model(self, topology, conductances, names):
+        """Build the leak model of the named components solving one unit leak per unknown
+           node, batched in chunks.
+        """
+        if len(topology.pipe_positions) > 0:
+            raise AttributeError('Leak sensitivities require a circuit without pipes.')
+        try:
+            meters = np.array([topology.names[name] for name in names], dtype=int)
+        except KeyError as exception:
+            raise AttributeError(f'Component {exception.args[0]} not found.') from None
+        # A node is named after the first component pin on it.
+        node_names = dict()
+        for name, (node_one, node_two) in zip(topology.names, zip(*topology.comp_nodes)):
+            node_names.setdefault(node_one, f'{name}.one')
+            node_names.setdefault(node_two, f'{name}.two')
+        nodes = [node_names[node] for node in topology.unknown_nodes]
+
+        branch_conductances = topology.branch_conductances(conductances)
+        matrix = np.full((len(nodes), len(meters)), np.nan)
+        solve = self._base_solve(topology, branch_conductances) if len(nodes) > 0 else None
+        if solve is not None:
+            # Chunks of at most 2**22 entries per leak matrix.
+            step = max(1, 2**22 // topology.size)
+            chunks = [np.arange(start, min(start + step, len(nodes)))
+                      for start in range(0, len(nodes), step)]
+            leaks = (_leak_columns(topology.size, chunk) for chunk in chunks)
+            solved = self._solve_columns(topology, branch_conductances, solve, leaks)
+            for chunk, changes in zip(chunks, solved):
+                matrix[chunk] = topology.meter_changes(changes, conductances, meters)
+        return _LeakModel(topology, conductances, meters, matrix, nodes)
+
+    def _kept_leak_model(self, names):
+        """Return the leak model of the named components for the current component values,
+           kept while the topology and resistances do not change.
+        """
+        names = tuple(names)
+        topology = self.topology
+        conductances = topology.conductances()
+        model = self.__leak_models.get(names)
+        if model is None or not model.valid(topology, conductances):
+            model = self.__leak_models[names] = self._leak_model(topology, conductances, names)
+        return model
+
+    def leak_sensitivities(self, meters):
+        """Return the candidate leak nodes, named after their first component pin ('NAME.one'
+           or 'NAME.two'), and the (nodes x meters) changes of the metered flows per unit of
+           flow leaking from each node to the reference. Every unknown node is a candidate.
+           The components are not modified.
+        """
+        model = self._kept_leak_model(meters)
+        return list(model.nodes), model.matrix.copy()
+
+    def rank_leaks(self, meters, deviations, count=None):
+        """Return the (node, score, leak) candidates that best explain the measured
+           deviations of the metered flows from their simulated values, best first (the
+           count best, or all of them).
+           score is the cosine between the deviations and the leak sensitivities of the
+           node (1 for a perfect match) and leak the least squares leak flow at it.
+           The sensitivities are computed once per topology and resistances, so every
+           query is one matrix-vector product.
+        """
+        return self._kept_leak_model(meters).rank(deviations, count)
 
-        self._update_component_values(comp_net_list, node_powers_vector)
-        self.print_components_info()
+    def _state_estimator(self, topology, conductances, names, weights):
+        """Assemble and factorize the normal equations of the state estimate for the named
+           meters. They are indefinite, so they are solved dense or with a sparse LU.
+        """
+        transducer_position = np.full(len(topology.names), -1)
+        transducer_position[topology.transducer_index] = np.arange(
+            len(topology.transducer_index))
+        try:
+            positions = transducer_position[[topology.names[name] for name in names]]
+        except KeyError as exception:
+            raise AttributeError(f'Component {exception.args[0]} not found.') from None
+        if np.any(positions < 0):
+            raise AttributeError('Only Transducers flows can be measured.')
+
+        # Series chains of metered transducers can not be reduced.
+        equations = topology if topology.reduction is None else self._compile_topology(False)
+        estimator = _StateEstimator(topology, conductances, weights, equations, positions)
+        size = estimator.size
+        singularity = None
+        if equations.size > 0:
+            singularity = equations.singularity(equations.branch_conductances(conductances))
+        if singularity is not None:
+            self.logger.error('Singular node equations: %s', singularity)
+        elif equations.size > 0:
+            solver = _DenseSolver() if sparse is None or size < SPARSE_MIN_UNKNOWNS \
+                else _SparseSolver()
+            estimator.solve = self._factorize(solver, estimator.rows, estimator.cols,
+                                              estimator.values, size)
+        return estimator
+
+    def estimate_state(self, meters, flows, weights=None):
+        """Estimate the state of the circuit from the measured flows of the named
+           Transducers by weighted least squares, the differences with the model taken as
+           demand deviations at the taps (see _StateEstimator). weights (1 by default) give
+           the confidence of every meter relative to the model demands.
+           Returns the estimated node powers, in the topology node order, the estimated
+           flows of every component, with the taps carrying the demand deviations, and the
+           residuals of the meters (measured minus estimated flow). The normal equations are
+           factorized once per topology, resistances and weights, so a tick only solves
+           them. The components are not modified.
+        """
+        names = tuple(meters)
+        flows = np.array(flows, dtype=float).reshape(-1)
+        weights = np.ones(len(names)) if weights is None else \
+            np.array(weights, dtype=float).reshape(-1)
+        if len(flows) != len(names) or len(weights) != len(names):
+            raise AttributeError('One flow and weight per meter is required.')
+        topology = self.topology
+        if len(topology.pipe_positions) > 0:
+            raise AttributeError('State estimation requires a circuit without pipes.')
+
+        conductances = topology.conductances()
+        estimator = self.__state_estimators.get(names)
+        if estimator is None or not estimator.valid(topology, conductances, weights):
+            estimator = self.__state_estimators[names] = self._state_estimator(
+                topology, conductances, names, weights)
+        equations = estimator.equations
+        node_powers_vector = equations.known_powers()
+        source_flows, currents = None, None
+        if equations.size > 0:
+            solutions_vector = np.full(estimator.size, np.nan)
+            if estimator.solve is not None:
+                solutions_vector = estimator.solve(estimator.constants(node_powers_vector,
+                                                                       flows))
+            node_powers_vector[equations.unknown_nodes], source_flows = equations.split(
+                solutions_vector[:equations.size])
+            currents = estimator.currents(
+                solutions_vector[equations.size:equations.size + len(estimator.taps)])
+        estimate = equations.flows(node_powers_vector, conductances,
+                                   self._table.cur[equations.flow_index], source_flows,
+                                   currents)
+        return node_powers_vector, estimate, flows - estimate[equations.transducer_index[
+            estimator.positions]]
+
+    def _flow_sensitivities(self, equations, conductances, meters, positions):
+        """Return the (meters x inputs) metered flows per unit of every input, the
+           (inputs x segments) ddp of the segments at the given transducer positions per
+           unit of every input and the (meters x segments) factors K of the derivatives of
+           the metered flows with the segment conductances: dS/dg_k = K[:, k]·ddp[:, k]ᵀ.
+           None when the node equations are singular.
+
+           Raising a conductance g_k by dg changes the node solutions by -A⁻¹·a_k·ddp_k·dg
+           (a_k the incidence column of the segment), so a meter reading the solutions
+           through the functional l_m changes by (t_mk - l_mᵀ·A⁻¹·a_k)·ddp_k·dg, t_mk being
+           the sign of the segment flow in the meter. The l_mᵀ·A⁻¹ rows are the adjoint
+           solves of the meters (A is symmetric), batched in chunks.
+        """
+        inputs_index = np.concatenate((equations.power_index, equations.flow_index))
+        parameter_matrix = np.zeros((len(inputs_index), len(equations.names)))
+        parameter_matrix[np.arange(len(inputs_index)), inputs_index] = 1.0
+        node_powers = equations.known_powers(parameter_matrix)
+        currents = parameter_matrix[:, equations.flow_index]
+        transducer_terms, source_terms = equations.meter_terms(meters)
+        rows, terms, signs = transducer_terms
+        segment_index = np.full(len(conductances), -1)
+        segment_index[positions] = np.arange(len(positions))
+        factors = np.zeros((len(meters), len(positions)))
+        np.add.at(factors, (rows[segment_index[terms] >= 0],
+                            segment_index[terms[segment_index[terms] >= 0]]),
+                  signs[segment_index[terms] >= 0])
+
+        source_flows = None
+        if equations.size > 0:
+            solve = self._factorize_islands(equations, conductances)[0]
+            if solve is None:
+                return None
+            solutions = solve(equations.constants(node_powers, conductances, currents,
+                                                  parameter_matrix).T)
+            node_powers[:, equations.unknown_nodes], source_flows = equations.split(solutions.T)
+
+            # Meter functionals, chunks of at most 2**22 entries.
+            p_one, p_two = equations.transducer_positions
+            functionals = np.zeros((equations.size + 1, len(meters)))
+            np.add.at(functionals, (p_one[terms], rows), signs*conductances[terms])
+            np.add.at(functionals, (p_two[terms], rows), -signs*conductances[terms])
+            source_rows, source_positions, source_signs = source_terms
+            np.add.at(functionals, (source_positions, source_rows), source_signs)
+            step = max(1, 2**22 // equations.size)
+            chunks = [np.arange(start, min(start + step, len(meters)))
+                      for start in range(0, len(meters), step)]
+            solved = self._solve_columns(equations, conductances, solve,
+                                         (functionals[:-1, chunk] for chunk in chunks))
+            for chunk, adjoints in zip(chunks, solved):
+                factors[chunk] -= equations.project(adjoints, positions).T
+
+        flows = equations.flows(node_powers, conductances, currents, source_flows)
+        ddp = equations.branch_powers(node_powers)[:, equations.transducer_index[positions]]
+        return flows[:, meters].T, ddp, factors
+
+    def calibrate(self, meters, history, segments=None, write_back=True):
+        """Fit the resistances of the segments (Transducers names, all of them in the
+           components order by default) to a recorded history of the flows of the named
+           meters, by nonlinear least squares.
+           history is an iterable of (inputs, flows) chunks of samples: the (samples x
+           inputs) PowerSrc ddp then FlowSrc cur, in the components order, and the (samples
+           x meters) measured flows. It is read once, chunk by chunk.
+
+           The metered flows are the sensor model matrix S times the inputs, so the squared
+           residuals of the whole history only depend on its sums of inputs and flows
+           products: the iterations never read the history again. They are damped
+           Gauss-Newton (Levenberg-Marquardt) steps on the logarithms of the resistances,
+           with the analytic Jacobian of S from one solve per input and one adjoint solve
+           per meter.
+           Returns the fitted resistances, in the segments order, and the root mean square
+           of the flow residuals. They are written in the segments when write_back is set.
+        """
+        topology = self.topology
+        if len(topology.pipe_positions) > 0:
+            raise AttributeError('Calibration requires a circuit without pipes.')
+        names = list(topology.names)
+        if segments is None:
+            segments = [names[index] for index in topology.transducer_index]
+        try:
+            meters = np.array([topology.names[name] for name in meters], dtype=int)
+            segments = np.array([topology.names[name] for name in segments], dtype=int)
+        except KeyError as exception:
+            raise AttributeError(f'Component {exception.args[0]} not found.') from None
+        transducer_position = np.full(len(names), -1)
+        transducer_position[topology.transducer_index] = np.arange(
+            len(topology.transducer_index))
+        positions = transducer_position[segments]
+        if np.any(positions < 0):
+            raise AttributeError('Only Transducers segments can be calibrated.')
+        resistances = self._table.res[segments]
+        if not np.all(np.isfinite(resistances) & (resistances > 0.0)):
+            raise AttributeError('Calibrated segments need a finite positive resistance.')
+
+        inputs_count = len(topology.power_index) + len(topology.flow_index)
+        inputs_products = np.zeros((inputs_count, inputs_count))
+        flow_products = np.zeros((inputs_count, len(meters)))
+        squares, samples = 0.0, 0
+        for inputs, flows in history:
+            inputs = np.array(inputs, dtype=float).reshape(-1, inputs_count)
+            flows = np.array(flows, dtype=float).reshape(-1, len(meters))
+            if len(inputs) != len(flows):
+                raise AttributeError('One inputs row is required for each flows row.')
+            inputs_products += inputs.T.dot(inputs)
+            flow_products += inputs.T.dot(flows)
+            squares += np.sum(flows*flows)
+            samples += len(flows)
+
+        # The squared residuals are those of the least squares sensor matrix plus the
+        # excess of the model one, computed without cancellation.
+        fitted = np.linalg.lstsq(inputs_products, flow_products, rcond=None)[0].T
+        floor = max(squares - np.sum(fitted.dot(inputs_products)*fitted), 0.0)
+
+        # Series chains of calibrated transducers can not be reduced.
+        equations = topology if topology.reduction is None else self._compile_topology(False)
+        base_conductances = topology.conductances()
+
+        def evaluate(logarithms):
+            conductances = base_conductances.copy()
+            conductances[positions] = np.exp(-logarithms)
+            model = self._flow_sensitivities(equations, conductances, meters, positions)
+            if model is None:
+                return None, np.inf
+            errors = fitted - model[0]
+            return model, np.sum(errors.dot(inputs_products)*errors)
+
+        logarithms = np.log(resistances)
+        model, cost = evaluate(logarithms)
+        damping = 1e-3
+        for _ in range(CALIBRATION_MAX_ITERATIONS):
+            if model is None:
+                break
+            sensor, ddp, factors = model
+            # Derivatives with the logarithms of the resistances: dg/dlog(r) = -g.
+            scales = -np.exp(-logarithms)
+            normal = factors.T.dot(factors)*ddp.T.dot(inputs_products).dot(ddp) * \
+                np.outer(scales, scales)
+            gradient = scales*np.sum(factors*(fitted - sensor).dot(inputs_products).dot(ddp),
+                                     axis=0)
+            diagonal = np.diag(normal)
+            if not np.any(diagonal > 0.0):
+                break
+            while damping < 1e12:
+                try:
+                    step = np.linalg.solve(normal + damping*diagonal.max()*np.eye(len(diagonal)),
+                                           gradient)
+                except np.linalg.LinAlgError:
+                    step = None
+                trial_model, trial_cost = (None, np.inf) if step is None else \
+                    evaluate(logarithms + step)
+                if trial_cost <= cost:
+                    break
+                damping *= 4.0
+            else:
+                break
+            decrease = cost - trial_cost
+            logarithms, model, cost = logarithms + step, trial_model, trial_cost
+            damping = max(damping/3.0, 1e-12)
+            if decrease <= CALIBRATION_TOLERANCE*(cost + floor):
+                break
+
+        resistances = np.exp(logarithms)
+        if write_back:
+            self._table.res[segments] = resistances
+        return resistances, float(np.sqrt((floor + cost)/max(samples*len(meters), 1)))
 
     def register_component(self, name, component):
         """Add a component to the Simulator component list."""
@@ -464,11 +2859,23 @@ class Simulator:
         if name in self._components:
             raise AttributeError('Name component is already in the list. Names must be unique.')
 
-        for c_name, c_el in self._components.items():
-            if component == c_el:
-                raise AttributeError('component is already in the list.')
+        if component._table is not None:
+            raise AttributeError('component is already in the list.')
+
+        if self._pin_type is int:
+            component._one = next(self._pin_counter)
+            component._two = next(self._pin_counter)
+        elif not isinstance(component.one, uuid.UUID):
+            component._one = uuid.uuid4()
+            component._two = uuid.uuid4()
 
         self._components[name] = component
+        pin_ids = self._pin_ids
+        self._table.append(component, (pin_ids.setdefault(component.one, len(pin_ids)),
+                                       pin_ids.setdefault(component.two, len(pin_ids))))
+        self._pin_components[component.one] = component
+        self._pin_components[component.two] = component
+        self.__topology = None
 
     def deregister_component(self, name):
         """Remove a component from the Simulator component list.
@@ -479,9 +2886,16 @@ class Simulator:
 
         component_to_remove = self.get_component(name)
 
-        for conn_tuple in self._net_list.copy():
-            if component_to_remove.one in conn_tuple or component_to_remove.two in conn_tuple:
-                self._net_list.remove(conn_tuple)
+        for pin in (component_to_remove.one, component_to_remove.two):
+            for conn_tuple in self._pin_nets.pop(pin, list()):
+                self._net_list.discard(conn_tuple)
+                other_pin = conn_tuple[1] if conn_tuple[0] == pin else conn_tuple[0]
+                if conn_tuple in self._pin_nets.get(other_pin, list()):
+                    self._pin_nets[other_pin].remove(conn_tuple)
+            self._pin_components.pop(pin)
+        self._table.remove(component_to_remove._row)
+        self._net_ends = None
+        self.__topology = None
 
         return self._components.pop(name)
 
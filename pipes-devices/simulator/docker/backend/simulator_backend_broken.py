@@ -190,12 +190,10 @@ async def simulator_client(sm):
     logger = logging.getLogger('SIM_CLIENT')
     while True:
         try:
-            sm.simulate()
+            result = sm.simulate()
 
             rdr, wtr = await asyncio.open_connection(FE_SERVER_HOST, FE_SERVER_PORT)
-            raw_comp_info = dict()
-            for c_name, component in sm.components.items():
-                raw_comp_info[c_name] = [component.ddp, component.res, component.cur]
+            raw_comp_info = result.to_dict()
 
             packet = {
                 'command': 'loadData',
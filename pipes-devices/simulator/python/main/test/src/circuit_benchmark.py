@@ -0,0 +1,454 @@
+"""Simulator benchmarks.
+
+Run from simulator/python/main with:  PYTHONPATH=src python test/src/circuit_benchmark.py
+"""
+import time
+import logging
+import tracemalloc
+import numpy as np
+import circuit
+
+
+def ladder_simulator(sections, int_pins=False):
+    """Ladder of transducers fed by one power source: a rung to ground on every section."""
+    sim = circuit.Simulator(int_pins=int_pins)
+    sim.register_component('SRC', circuit.PowerSrc(ddp=10))
+    ground = sim.get_component('SRC').two
+    previous = sim.get_component('SRC').one
+    for index in range(sections):
+        segment = circuit.Transducers(res=1.0 + index % 3)
+        rung = circuit.Transducers(res=5.0)
+        sim.register_component(f'S{index}', segment)
+        sim.register_component(f'R{index}', rung)
+        sim.connect(previous, segment.one)
+        sim.connect(segment.two, rung.one)
+        sim.connect(rung.two, ground)
+        previous = segment.two
+    sim.reference = ground
+    return sim
+
+
+def demo_simulator():
+    """Pipe demo network of simulator_backend.define_simulator (16 components)."""
+    sim = circuit.Simulator()
+    sim.register_component('WATER_IN_1', circuit.PowerSrc(ddp=100))
+    pipes = ['PIPE_1_S1', 'PIPE_1_S2', 'PIPE_1_S3', 'PIPE_1_S4', 'PIPE_1_S5', 'PIPE_1_S6']
+    for name in pipes + ['PIPE_2_S1', 'PIPE_2_S2', 'PIPE_3_S1', 'PIPE_3_S2', 'PIPE_4_S1',
+                         'PIPE_4_S2', 'TAP_1', 'TAP_2', 'TAP_3']:
+        sim.register_component(name, circuit.Transducers(res=1))
+
+    sim.connect(sim.get_component('WATER_IN_1').one, sim.get_component('PIPE_1_S1').one)
+    for pipe_l, pipe_r in zip(pipes, pipes[1:]):
+        sim.connect(sim.get_component(pipe_l).two, sim.get_component(pipe_r).one)
+    for branch in ('2', '3', '4'):
+        sim.connect(sim.get_component('PIPE_1_S6').two,
+                    sim.get_component(f'PIPE_{branch}_S1').one)
+        sim.connect(sim.get_component(f'PIPE_{branch}_S1').two,
+                    sim.get_component(f'PIPE_{branch}_S2').one)
+        sim.connect(sim.get_component(f'PIPE_{branch}_S2').two,
+                    sim.get_component(f'TAP_{int(branch) - 1}').one)
+        sim.connect(sim.get_component(f'TAP_{int(branch) - 1}').two,
+                    sim.get_component('WATER_IN_1').two)
+    sim.reference = sim.get_component('WATER_IN_1').two
+    return sim
+
+
+def pipes_simulator(pipes, segments):
+    """Pipes of many metered segments in series, branching from one main pipe to ground."""
+    sim = circuit.Simulator()
+    sim.register_component('SRC', circuit.PowerSrc(ddp=100))
+    ground = sim.get_component('SRC').two
+    junction = sim.get_component('SRC').one
+    for pipe in range(pipes):
+        main = circuit.Transducers(res=0.5)
+        sim.register_component(f'MAIN_{pipe}', main)
+        sim.connect(junction, main.one)
+        junction = previous = main.two
+        for index in range(segments):
+            segment = circuit.Transducers(res=1.0 + index % 3)
+            sim.register_component(f'PIPE_{pipe}_S{index}', segment)
+            sim.connect(previous, segment.one)
+            previous = segment.two
+        tap = circuit.Transducers(res=10.0)
+        sim.register_component(f'TAP_{pipe}', tap)
+        sim.connect(previous, tap.one)
+        sim.connect(tap.two, ground)
+    sim.reference = ground
+    return sim
+
+
+def tree_simulator(segments, fanout=4):
+    """Distribution tree of pipe segments: every segment feeds fanout segments and the last
+       ones end in a tap to ground.
+    """
+    sim = circuit.Simulator(int_pins=True)
+    sim.register_component('SRC', circuit.PowerSrc(ddp=100))
+    ground = sim.get_component('SRC').two
+    ends = [sim.get_component('SRC').one]
+    for index in range(segments):
+        segment = circuit.Transducers(res=1.0 + index % 3)
+        sim.register_component(f'S{index}', segment)
+        sim.connect(ends[index // fanout], segment.one)
+        ends.append(segment.two)
+    for index in range((segments - 1) // fanout, segments):
+        tap = circuit.Transducers(res=10.0)
+        sim.register_component(f'TAP{index}', tap)
+        sim.connect(ends[index + 1], tap.one)
+        sim.connect(tap.two, ground)
+    sim.reference = ground
+    return sim
+
+
+def grid_simulator(side, element=circuit.Transducers):
+    """Square mesh of pipe segments fed at one corner, with a tap to ground on every node.
+       element is the class of the segments and taps.
+    """
+    sim = circuit.Simulator(int_pins=True)
+    sim.register_component('SRC', circuit.PowerSrc(ddp=100))
+    ground = sim.get_component('SRC').two
+    nodes = list()
+    for index in range(side*side):
+        tap = element(res=50.0)
+        sim.register_component(f'TAP{index}', tap)
+        sim.connect(tap.two, ground)
+        nodes.append(tap.one)
+    sim.connect(sim.get_component('SRC').one, nodes[0])
+    for index in range(side*side):
+        row, col = divmod(index, side)
+        for neighbour, name in ((index + 1, 'H'), (index + side, 'V')):
+            if (name == 'H' and col + 1 < side) or (name == 'V' and row + 1 < side):
+                segment = element(res=1.0 + index % 3)
+                sim.register_component(f'{name}{index}', segment)
+                sim.connect(nodes[index], segment.one)
+                sim.connect(segment.two, nodes[neighbour])
+    sim.reference = ground
+    return sim
+
+
+def time_ticks(sim, ticks=3):
+    """Return the best wall-clock time of a simulate() call."""
+    best = float('inf')
+    for _ in range(ticks):
+        start = time.perf_counter()
+        sim.simulate()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_tick_scaling(sizes=(1000, 2000, 4000, 8000, 16000, 32000)):
+    """Per-tick cost against component count. A flat us/comp column means linear scaling."""
+    print(f'{"components":>12} {"tick (s)":>12} {"us/comp":>10}')
+    for sections in sizes:
+        sim = ladder_simulator(sections)
+        elapsed = time_ticks(sim)
+        components = len(sim.components)
+        print(f'{components:>12} {elapsed:>12.4f} {1e6*elapsed/components:>10.2f}')
+
+
+def bench_first_tick(sections=50000, side=300):
+    """First tick, with the topology compile, and next ticks of a 100k component ladder and
+       a 300x300 grid (270k components).
+    """
+    print(f'{"network":>8} {"components":>12} {"first (s)":>10} {"compile (s)":>12} '
+          f'{"next (s)":>10}')
+    for label, sim in (('ladder', ladder_simulator(sections)), ('grid', grid_simulator(side))):
+        sim.profiling = True
+        start = time.perf_counter()
+        sim.simulate()
+        first = time.perf_counter() - start
+        compile_time = sum(sim.stats.timings[phase] for phase in (
+            'check_net_list', 'node_list', 'net_list', 'partition', 'incidence'))
+        sim.profiling = False
+        print(f'{label:>8} {len(sim.components):>12} {first:>10.3f} {compile_time:>12.3f} '
+              f'{time_ticks(sim):>10.4f}')
+
+
+def bench_component_update(repeat=100):
+    """Branch flows and source flows written back from the node powers (incidence products)."""
+    print(f'{"network":>10} {"components":>12} {"update (us)":>12}')
+    for label, sim in (('demo', demo_simulator()), ('synthetic', ladder_simulator(25000))):
+        sim.simulate()
+        topology = sim.topology
+        node_powers_vector = topology.known_powers()
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            sim._update_component_values(topology, node_powers_vector)
+            best = min(best, time.perf_counter() - start)
+        print(f'{label:>10} {len(sim.components):>12} {1e6*best:>12.1f}')
+
+
+def bench_reduction(pipes=200, segments=50):
+    """Unknowns and tick time of a meter-dense pipe network with the series/parallel reduction
+       off and on. The ticks change one resistance so every one refactorizes the system.
+    """
+    print(f'{"reduce":>8} {"unknowns":>10} {"tick (s)":>10}')
+    for reduce in (False, True):
+        sim = pipes_simulator(pipes, segments)
+        sim.reduce = reduce
+        sim.simulate()
+        best = float('inf')
+        for tick in range(3):
+            for index in range(circuit.MAX_RANK_UPDATES + 1):
+                sim.get_component(f'PIPE_{index}_S0').res = 2.0 + tick
+            start = time.perf_counter()
+            sim.simulate()
+            best = min(best, time.perf_counter() - start)
+        print(f'{str(reduce):>8} {sim.topology.size:>10} {best:>10.4f}')
+
+
+def bench_metered_flows(repeat=100):
+    """Tick cost of a full simulate() against the sensor model of 12 metered components."""
+    print(f'{"network":>10} {"simulate (us)":>14} {"metered (us)":>13}')
+    for label, sim in (('demo', demo_simulator()), ('synthetic', ladder_simulator(25000))):
+        names = list(sim.components)
+        source, meters = sim.get_component(names[0]), names[-12:]
+        sim.metered_flows(meters)
+        timings = list()
+        for tick in (sim.simulate, lambda: sim.metered_flows(meters)):
+            best = float('inf')
+            for index in range(repeat):
+                source.ddp = 10.0 + index % 2
+                start = time.perf_counter()
+                tick()
+                best = min(best, time.perf_counter() - start)
+            timings.append(best)
+        print(f'{label:>10} {1e6*timings[0]:>14.1f} {1e6*timings[1]:>13.1f}')
+
+
+def bench_solvers(sizes=(10000, 100000, 1000000), solvers=('sparse', 'cg', 'tree')):
+    """Solver time (factorization and solve phases) of the solver backends on trees of
+       10k-1M segments. Deep trees, like the ladder, are not swept (see TREE_LEVEL_WIDTH).
+       The source tick only changes a PowerSrc ddp, the resistance tick changes more
+       resistances than the low-rank updates take, so the system is factorized again.
+    """
+    print(f'{"network":>8} {"segments":>9} {"solver":>7} {"source tick (s)":>16} '
+          f'{"res tick (s)":>13}')
+    for label, fanout in (('binary', 2), ('tree', 4)):
+        for segments in sizes:
+            sim = tree_simulator(segments, fanout)
+            sim.profiling = True
+            for solver in solvers:
+                sim.solver = solver
+                timings = list()
+                for changed in (['SRC'], [f'S{index}' for index in range(9)]):
+                    best = float('inf')
+                    for tick in range(3):
+                        for name in changed:
+                            component = sim.get_component(name)
+                            if name == 'SRC':
+                                component.ddp = 100.0 + tick
+                            else:
+                                component.res = 1.0 + tick
+                        sim.simulate()
+                        best = min(best, sim.stats.timings.get('factorization', 0.0) +
+                                   sim.stats.timings['solve'])
+                    timings.append(best)
+                print(f'{label:>8} {segments:>9} {sim.stats.solver:>7} {timings[0]:>16.4f} '
+                      f'{timings[1]:>13.4f}')
+            del sim
+
+
+def bench_warm_start(sides=(100, 300), ticks=5):
+    """Conjugate gradient iterations and solve time per tick on square meshes: the first
+       tick starts from zero, the next ones from the last solution after a small source change.
+    """
+    print(f'{"nodes":>8} {"solver":>7} {"precond":>8} {"cold (s)":>9} {"cold it":>8} '
+          f'{"warm (s)":>9} {"warm it":>8}')
+    for side in sides:
+        sim = grid_simulator(side)
+        sim.profiling = True
+        for solver, preconditioner in (('sparse', ''), ('cg', 'jacobi'), ('cg', 'ic')):
+            sim.solver = solver
+            sim.cg_preconditioner = preconditioner or circuit.CG_PRECONDITIONERS[0]
+            timings, iterations = list(), list()
+            for tick in range(ticks):
+                sim.get_component('SRC').ddp = 100.0 + 0.01*tick
+                sim.simulate()
+                timings.append(sim.stats.timings.get('factorization', 0.0) +
+                               sim.stats.timings['solve'])
+                iterations.append(sim.stats.counters.get('iterations', 0))
+            print(f'{side*side:>8} {solver:>7} {preconditioner:>8} {timings[0]:>9.4f} '
+                  f'{iterations[0]:>8} {min(timings[1:]):>9.4f} {max(iterations[1:]):>8}')
+        del sim
+
+
+def bench_pipes(sides=(30, 100, 300), ticks=6):
+    """Newton iterations, Jacobians and tick time of meshes of quadratic head loss pipes:
+       the first tick starts from the linear solution, the next ones from the last tick after
+       a small source change.
+    """
+    print(f'{"nodes":>8} {"cold (s)":>9} {"cold it":>8} {"warm (s)":>9} {"warm it":>8} '
+          f'{"jacobians":>10}')
+    for side in sides:
+        sim = grid_simulator(side, circuit.Pipe)
+        sim.profiling = True
+        timings, iterations, jacobians = list(), list(), 0
+        for tick in range(ticks):
+            sim.get_component('SRC').ddp = 100.0 + 0.1*tick
+            sim.simulate()
+            timings.append(sim.stats.total)
+            iterations.append(sim.stats.counters['newton_iterations'])
+            jacobians += sim.stats.counters.get('jacobians', 0) if tick else 0
+        print(f'{side*side:>8} {timings[0]:>9.4f} {iterations[0]:>8} '
+              f'{sum(timings[1:])/(ticks - 1):>9.4f} {max(iterations[1:]):>8} {jacobians:>10}')
+        del sim
+
+
+def bench_transient(sides=(30, 100, 300), steps=100, tanks=100):
+    """Time per transient step of meshes with tanks on some nodes, against the first steady
+       state tick (topology compile and factorization).
+    """
+    print(f'{"nodes":>8} {"tanks":>6} {"first (s)":>10} {"step (s)":>9} '
+          f'{"factorizations":>15}')
+    for side in sides:
+        sim = grid_simulator(side)
+        ground = sim.get_component('SRC').two
+        nodes = range(0, side*side, max(1, side*side // tanks))
+        for index in nodes:
+            tank = circuit.Tank(cap=5.0)
+            sim.register_component(f'TANK{index}', tank)
+            sim.connect(sim.get_component(f'TAP{index}').one, tank.one)
+            sim.connect(tank.two, ground)
+        sim.profiling = True
+        sim.simulate()
+        tick = sim.stats.total
+        factorizations = 0
+        start = time.perf_counter()
+        for _ in sim.simulate_transient(1.0, steps):
+            factorizations += sim.stats.counters.get('factorizations', 0)
+        step = (time.perf_counter() - start)/steps
+        print(f'{side*side:>8} {len(nodes):>6} {tick:>10.4f} {step:>9.4f} '
+              f'{factorizations:>15}')
+        del sim
+
+
+def bench_contingency(sides=(10, 30, 60), meters=12):
+    """N-1 scan of every segment of square meshes: contingency_scan against closing each
+       segment and simulating (timed over the first 50 segments and extrapolated).
+    """
+    print(f'{"nodes":>8} {"segments":>9} {"scan (s)":>9} {"loop (s)":>9}')
+    for side in sides:
+        sim = grid_simulator(side)
+        names = list(sim.components)
+        segments = [name for name in names if name[0] in 'HV']
+        metered = names[-meters:]
+        start = time.perf_counter()
+        sim.contingency_scan(metered, segments)
+        scan = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for name in segments[:50]:
+            segment = sim.get_component(name)
+            res, segment.res = segment.res, float('inf')
+            sim.simulate(write_back=False)
+            segment.res = res
+        loop = (time.perf_counter() - start)*len(segments)/min(50, len(segments))
+        print(f'{side*side:>8} {len(segments):>9} {scan:>9.4f} {loop:>9.4f}')
+        del sim
+
+
+def bench_leaks(sides=(10, 30, 60, 100), meters=12, queries=1000):
+    """Leak sensitivities of every node of square meshes and the time of one ranking."""
+    print(f'{"nodes":>8} {"precompute (s)":>15} {"query (ms)":>11}')
+    for side in sides:
+        sim = grid_simulator(side)
+        metered = list(sim.components)[-meters:]
+        start = time.perf_counter()
+        nodes, sensitivities = sim.leak_sensitivities(metered)
+        precompute = time.perf_counter() - start
+
+        deviations = 0.1*sensitivities[len(nodes)//2]
+        start = time.perf_counter()
+        for _ in range(queries):
+            sim.rank_leaks(metered, deviations, count=5)
+        query = (time.perf_counter() - start)*1e3/queries
+        print(f'{len(nodes):>8} {precompute:>15.4f} {query:>11.4f}')
+        del sim
+
+
+def bench_state_estimation(sides=(30, 100, 200), meters=300, ticks=10):
+    """Weighted least squares state estimation from a few hundred metered segments and taps
+       of square meshes: first call (assembly and factorization) and following ticks.
+    """
+    print(f'{"nodes":>8} {"meters":>7} {"first (s)":>10} {"tick (s)":>9}')
+    for side in sides:
+        sim = grid_simulator(side)
+        names = list(sim.components)[1:]
+        metered = names[::max(1, len(names)//meters)][:meters]
+        result = sim.simulate(write_back=False)
+        measured = [result[name][2]*1.01 for name in metered]
+        start = time.perf_counter()
+        sim.estimate_state(metered, measured)
+        first = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for tick in range(ticks):
+            sim.estimate_state(metered, [flow*(1.0 + 0.001*tick) for flow in measured])
+        tick = (time.perf_counter() - start)/ticks
+        print(f'{side*side:>8} {len(metered):>7} {first:>10.4f} {tick:>9.4f}')
+        del sim
+
+
+def bench_calibration(side=30, meters=300, segments=200, samples=86400, chunk=3600):
+    """Resistance calibration from a day of 1 second samples of a few hundred meters of a
+       square mesh, streamed in chunks of an hour: peak memory and time.
+    """
+    sim = grid_simulator(side)
+    names = list(sim.components)[1:]
+    metered = names[::len(names)//meters][:meters]
+    calibrated = [name for name in names if name[0] in 'HV'][:segments]
+    unit_flows = np.array(sim.metered_flows(metered))/100.0
+    rng = np.random.default_rng(0)
+
+    def history():
+        for _ in range(samples//chunk):
+            heads = 100.0 + 5.0*rng.standard_normal((chunk, 1))
+            yield heads, heads*unit_flows + 1e-4*rng.standard_normal((chunk, len(metered)))
+
+    for index, name in enumerate(calibrated):
+        sim.get_component(name).res = sim.get_component(name).res*(1.0 + 0.1*(index % 3))
+    tracemalloc.start()
+    start = time.perf_counter()
+    _, rms = sim.calibrate(metered, history(), calibrated)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]/2**20
+    tracemalloc.stop()
+    print(f'{"samples":>8} {"meters":>7} {"segments":>9} {"time (s)":>9} {"peak (MB)":>10} '
+          f'{"rms":>9}')
+    print(f'{samples:>8} {len(metered):>7} {len(calibrated):>9} {elapsed:>9.2f} {peak:>10.1f} '
+          f'{rms:>9.2e}')
+
+
+def bench_pin_ids(sections=100000):
+    """Network build time and memory with uuid pins against integer pins."""
+    print(f'{"pins":>6} {"build (s)":>10} {"memory (MB)":>12}')
+    for int_pins in (False, True):
+        start = time.perf_counter()
+        ladder_simulator(sections, int_pins)
+        elapsed = time.perf_counter() - start
+
+        tracemalloc.start()
+        sim = ladder_simulator(sections, int_pins)
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print(f'{"int" if int_pins else "uuid":>6} {elapsed:>10.3f} {memory/2**20:>12.1f}')
+        del sim
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    bench_tick_scaling()
+    bench_first_tick()
+    bench_component_update()
+    bench_pin_ids()
+    bench_reduction()
+    bench_metered_flows()
+    bench_solvers()
+    bench_warm_start()
+    bench_pipes()
+    bench_transient()
+    bench_contingency()
+    bench_leaks()
+    bench_state_estimation()
+    bench_calibration()
@@ -40,7 +40,9 @@
 ,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,,
 ----------------------------------------------------------------------------------------------------
 """
+import math
 import logging
+import concurrent.futures
 import circuit
 
 logging.basicConfig(level=logging.INFO)
@@ -85,3 +87,735 @@ SM.connect(SM.get_component('TAP_3').two, SM.get_component('WATER_IN_1').two)
 SM.reference = SM.get_component('WATER_IN_1').two
 
 SM.simulate()
+
+
+def _ladder(sections):
+    """Ladder of transducers fed by one power source: a rung to ground on every section."""
+    sim = circuit.Simulator()
+    sim.register_component('SRC', circuit.PowerSrc(ddp=10))
+    ground = sim.get_component('SRC').two
+    previous = sim.get_component('SRC').one
+    for index in range(sections):
+        sim.register_component(f'S{index}', circuit.Transducers(res=1.0 + index % 3))
+        sim.register_component(f'R{index}', circuit.Transducers(res=5.0))
+        sim.connect(previous, sim.get_component(f'S{index}').one)
+        sim.connect(sim.get_component(f'S{index}').two, sim.get_component(f'R{index}').one)
+        sim.connect(sim.get_component(f'R{index}').two, ground)
+        previous = sim.get_component(f'S{index}').two
+    sim.reference = ground
+    return sim
+
+
+def test_sparse_solution_matches_dense(monkeypatch):
+    sim = _ladder(250)
+    sim.simulate()
+    sparse_values = {name: comp.cur for name, comp in sim.components.items()}
+
+    monkeypatch.setattr(circuit, 'SPARSE_MIN_UNKNOWNS', 10**9)
+    sim.simulate()
+    for name, comp in sim.components.items():
+        assert abs(comp.cur - sparse_values[name]) < 1e-9
+
+
+def test_chained_connections_share_one_node():
+    sim = circuit.Simulator()
+    sim.register_component('SRC', circuit.PowerSrc(ddp=12))
+    for name, res in (('R_ONE', 1.0), ('R_TWO', 2.0), ('R_THREE', 3.0)):
+        sim.register_component(name, circuit.Transducers(res=res))
+        sim.connect(sim.get_component(name).two, sim.get_component('SRC').two)
+    # The junction is only closed by the last connection.
+    sim.connect(sim.get_component('SRC').one, sim.get_component('R_ONE').one)
+    sim.connect(sim.get_component('R_TWO').one, sim.get_component('R_THREE').one)
+    sim.connect(sim.get_component('R_THREE').one, sim.get_component('R_ONE').one)
+    sim.reference = sim.get_component('SRC').two
+    sim.simulate()
+
+    assert abs(sim.get_component('R_ONE').cur - 12.0) < 1e-9
+    assert abs(sim.get_component('R_TWO').cur - 6.0) < 1e-9
+    assert abs(sim.get_component('R_THREE').cur - 4.0) < 1e-9
+    assert abs(sim.get_component('SRC').cur + 22.0) < 1e-9
+
+
+def test_topology_cached_until_topology_change():
+    sim = _ladder(3)
+    sim.simulate()
+    topology = sim.topology
+    sim.get_component('R2').res = 10.0
+    sim.simulate()
+    assert sim.topology is topology
+    assert abs(sim.get_component('R2').cur - sim.get_component('R2').ddp/10.0) < 1e-12
+
+    sim.register_component('R_EXTRA', circuit.Transducers(res=1.0))
+    sim.connect(sim.get_component('R_EXTRA').one, sim.get_component('S2').two)
+    sim.connect(sim.get_component('R_EXTRA').two, sim.get_component('SRC').two)
+    sim.simulate()
+    assert sim.topology is not topology
+    assert abs(sim.get_component('R_EXTRA').cur - sim.get_component('R2').ddp) < 1e-12
+
+
+def test_nodes_follow_deregistration_and_unregistered_pins():
+    sim = _ladder(4)
+    sim.simulate()
+    sim.deregister_component('S3')
+    sim.deregister_component('R3')
+    expected = _ladder(3)
+    expected_result, result = expected.simulate(), sim.simulate()
+    for name in expected.components:
+        assert abs(result[name][2] - expected_result[name][2]) < 1e-12
+
+    # Pins joined through the pin of an unregistered element share one node.
+    joint = circuit.Transducers(res=1.0)
+    sim.register_component('R_EXTRA', circuit.Transducers(res=1.0))
+    sim.connect(sim.get_component('R_EXTRA').one, joint.one)
+    sim.connect(joint.one, sim.get_component('S2').two)
+    sim.connect(sim.get_component('R_EXTRA').two, sim.get_component('SRC').two)
+    result = sim.simulate()
+    assert len(sim.topology.node_list) == len(expected.topology.node_list)
+    assert abs(result['R_EXTRA'][2] - result['R2'][0]) < 1e-12
+
+
+def test_source_change_reuses_factorization(monkeypatch):
+    calls = list()
+    factorize = circuit.Simulator._factorize_islands
+    monkeypatch.setattr(circuit.Simulator, '_factorize_islands',
+                        lambda sim, *args: calls.append(args) or factorize(sim, *args))
+    sim = _ladder(5)
+    sim.simulate()
+    half_cur = sim.get_component('R4').cur
+    sim.get_component('SRC').ddp = 20.0
+    sim.simulate()
+    assert len(calls) == 1
+    assert abs(sim.get_component('R4').cur - 2.0*half_cur) < 1e-12
+
+
+def test_resistance_change_updates_factorization(monkeypatch):
+    expected = _ladder(6)
+    expected.get_component('R1').res = 0.5
+    expected.get_component('S4').res = 0.5
+    expected.simulate()
+
+    calls = list()
+    factorize = circuit.Simulator._factorize_islands
+    monkeypatch.setattr(circuit.Simulator, '_factorize_islands',
+                        lambda sim, *args: calls.append(args) or factorize(sim, *args))
+    sim = _ladder(6)
+    sim.max_rank_updates = 2
+    sim.simulate()
+    for name in ('R1', 'S4'):
+        sim.get_component(name).res = 0.5
+        sim.simulate()
+        assert len(calls) == 1
+    for name, comp in expected.components.items():
+        assert abs(sim.get_component(name).cur - comp.cur) < 1e-9
+
+    sim.get_component('R5').res = 0.5
+    sim.simulate()
+    assert len(calls) == 2
+
+
+def test_closing_transducers_does_not_depend_on_history(caplog):
+    # Closing both transducers of the last node isolates it, within max_rank_updates.
+    sim = _ladder(4)
+    sim.simulate()
+    for name in ('S3', 'R3'):
+        sim.get_component(name).res = float('inf')
+    result = sim.simulate()
+    assert 'Singular node equations' in caplog.text
+    assert all(math.isnan(cur) for cur in result.cur)
+
+    sim.get_component('R3').res = 5.0
+    expected = _ladder(4)
+    expected.get_component('S3').res = float('inf')
+    assert max(abs(sim.simulate().cur - expected.simulate().cur)) < 1e-12
+
+
+def test_simulate_batch_matches_simulate():
+    sim = _ladder(4)
+    sim.simulate()
+    live = {name: (comp.ddp, comp.res, comp.cur) for name, comp in sim.components.items()}
+    names = list(sim.components)
+    base = [10.0] + [1.0 + index // 2 % 3 if index % 2 == 0 else 5.0 for index in range(8)]
+    scenarios = [base, list(base), list(base)]
+    scenarios[1][0] = 20.0
+    scenarios[2][names.index('R2')] = 0.25
+    _, flows = sim.simulate_batch(scenarios)
+
+    assert {name: (comp.ddp, comp.res, comp.cur) for name, comp in sim.components.items()} == live
+    for scenario, scenario_flows in zip(scenarios, flows):
+        expected = _ladder(4)
+        expected.get_component('SRC').ddp = scenario[0]
+        expected.get_component('R2').res = scenario[names.index('R2')]
+        expected.simulate()
+        for index, name in enumerate(names):
+            assert abs(scenario_flows[index] - expected.get_component(name).cur) < 1e-9
+
+
+def test_simulate_batch_only_loses_singular_scenarios():
+    sim = _ladder(4)
+    names = list(sim.components)
+    base = [10.0] + [1.0 + index // 2 % 3 if index % 2 == 0 else 5.0 for index in range(8)]
+    scenarios = [base, list(base), list(base)]
+    # Both transducers of the last node closed: it is isolated.
+    scenarios[1][names.index('S3')] = scenarios[1][names.index('R3')] = float('inf')
+    scenarios[2][names.index('R2')] = 0.25
+    _, flows = sim.simulate_batch(scenarios)
+
+    assert all(math.isnan(flow) for flow in flows[1])
+    for scenario in (0, 2):
+        expected = _ladder(4)
+        expected.get_component('R2').res = scenarios[scenario][names.index('R2')]
+        expected.simulate()
+        for index, name in enumerate(names):
+            assert abs(flows[scenario][index] - expected.get_component(name).cur) < 1e-9
+
+
+def test_registered_elements_are_table_views():
+    sim = _ladder(3)
+    sim.simulate()
+    rung = sim.get_component('R1')
+    assert not hasattr(rung, '__dict__')
+    rung.res = 7.0
+    assert sim._table.res[rung._row] == 7.0
+
+    flow = rung.cur
+    assert sim.deregister_component('R1') is rung
+    assert (rung.res, rung.cur) == (7.0, flow)
+    assert [view._row for view in sim._table.views] == list(range(sim._table.size))
+    assert all(sim._table.res[view._row] == view.res for view in sim._table.views)
+
+
+def test_int_pins_match_uuid_pins():
+    uuid_sim = _ladder(5)
+    int_sim = circuit.Simulator(int_pins=True)
+    for name, comp in uuid_sim.components.items():
+        int_sim.register_component(name, type(comp)(ddp=comp.ddp, res=comp.res, cur=comp.cur))
+    pins = {comp.one: (name, 'one') for name, comp in uuid_sim.components.items()}
+    pins.update({comp.two: (name, 'two') for name, comp in uuid_sim.components.items()})
+    for pin_l, pin_r in uuid_sim._net_list:
+        int_sim.connect(*[getattr(int_sim.get_component(name), side)
+                          for name, side in (pins[pin_l], pins[pin_r])])
+    int_sim.reference = int_sim.get_component('SRC').two
+    assert isinstance(int_sim.get_component('R3').one, int)
+
+    uuid_sim.simulate()
+    int_sim.simulate()
+    for name, comp in uuid_sim.components.items():
+        assert int_sim.get_component(name).cur == comp.cur
+
+
+def test_power_source_flow_follows_kirchhoff_law():
+    sim = circuit.Simulator()
+    sim.register_component('SRC', circuit.PowerSrc(ddp=12))
+    sim.register_component('R_ONE', circuit.Transducers(res=3.0))
+    sim.register_component('R_TWO', circuit.Transducers(res=6.0))
+    sim.connect(sim.get_component('SRC').two, sim.get_component('R_ONE').one)
+    sim.connect(sim.get_component('R_ONE').two, sim.get_component('R_TWO').one)
+    sim.connect(sim.get_component('R_TWO').two, sim.get_component('SRC').one)
+    sim.reference = sim.get_component('SRC').one
+    sim.simulate()
+
+    assert abs(sim.get_component('R_ONE').cur + 4.0/3.0) < 1e-12
+    assert abs(sim.get_component('SRC').cur - sim.get_component('R_ONE').cur) < 1e-12
+
+
+def test_profiling_stats_are_opt_in():
+    sim = _ladder(3)
+    sim.simulate()
+    assert sim.stats is None
+
+    received = list()
+    sim.profiling = True
+    sim.stats_callback = received.append
+    sim.simulate()
+    assert received == [sim.stats]
+    assert set(sim.stats.timings) == {'assembly', 'solve', 'update'}
+    assert sim.stats.counters['unknowns'] == 3
+
+
+def test_simulation_result_is_an_immutable_snapshot():
+    sim = _ladder(3)
+    result = sim.simulate()
+    values = result['R0']
+    assert values == [sim.get_component('R0').ddp, sim.get_component('R0').res,
+                      sim.get_component('R0').cur]
+    assert not result.cur.flags.writeable
+
+    sim.get_component('SRC').ddp = 20.0
+    later = sim.simulate(write_back=False)
+    assert result['R0'] == values
+    assert later.tick == result.tick + 1
+    assert abs(later['R0'][0] - 2*values[0]) < 1e-12
+    assert sim.get_component('R0').ddp == values[0]
+
+
+def test_floating_power_source_is_solved():
+    sim = circuit.Simulator()
+    sim.register_component('SRC', circuit.PowerSrc(ddp=10))
+    sim.register_component('R_ONE', circuit.Transducers(res=1.0))
+    sim.register_component('PUMP', circuit.PowerSrc(ddp=5))
+    sim.register_component('R_TWO', circuit.Transducers(res=1.0))
+    sim.connect(sim.get_component('SRC').one, sim.get_component('R_ONE').one)
+    sim.connect(sim.get_component('R_ONE').two, sim.get_component('PUMP').two)
+    sim.connect(sim.get_component('PUMP').one, sim.get_component('R_TWO').one)
+    sim.connect(sim.get_component('R_TWO').two, sim.get_component('SRC').two)
+    sim.reference = sim.get_component('SRC').two
+    result = sim.simulate()
+
+    assert abs(result['R_ONE'][2] - 7.5) < 1e-12
+    assert abs(result['R_TWO'][2] - 7.5) < 1e-12
+    assert abs(result['PUMP'][2] + 7.5) < 1e-12
+    assert abs(result['SRC'][2] + 7.5) < 1e-12
+    assert abs(result['PUMP'][0] - 5.0) < 1e-12
+
+    _, flows = sim.simulate_batch([[10.0, 1.0, 5.0, 1.0], [10.0, 1.0, -10.0, 1.0]])
+    assert all(abs(flow - cur) < 1e-12 for flow, cur in zip(flows[0], result.cur))
+    assert all(abs(flow) < 1e-12 for flow in flows[1])
+
+
+def test_floating_pump_without_couplings_is_solved():
+    # No transducer joins an unknown node to a known one: the couplings are empty.
+    sim = circuit.Simulator()
+    sim.register_component('SRC', circuit.PowerSrc(ddp=10))
+    sim.register_component('RG', circuit.Transducers(res=5.0))
+    sim.register_component('PUMP', circuit.PowerSrc(ddp=4))
+    sim.register_component('RA', circuit.Transducers(res=2.0))
+    sim.register_component('RB', circuit.Transducers(res=2.0))
+    sim.register_component('DEMAND', circuit.FlowSrc(cur=1.5))
+    sim.connect(sim.get_component('SRC').one, sim.get_component('RG').two)
+    sim.connect(sim.get_component('SRC').two, sim.get_component('RG').one)
+    sim.connect(sim.get_component('SRC').two, sim.get_component('PUMP').one)
+    sim.connect(sim.get_component('PUMP').two, sim.get_component('RA').one)
+    sim.connect(sim.get_component('PUMP').two, sim.get_component('RB').one)
+    sim.connect(sim.get_component('RA').two, sim.get_component('RB').two)
+    sim.connect(sim.get_component('RA').two, sim.get_component('DEMAND').one)
+    sim.connect(sim.get_component('DEMAND').two, sim.get_component('SRC').one)
+    sim.reference = sim.get_component('SRC').one
+    result = sim.simulate()
+
+    assert abs(result['RA'][2] + 0.75) < 1e-12 and abs(result['RB'][2] + 0.75) < 1e-12
+    assert abs(result['PUMP'][2] + 1.5) < 1e-12
+    assert abs(result['RG'][2] + 2.0) < 1e-12
+    assert abs(result['SRC'][2] + 3.5) < 1e-12
+
+
+def _floors(sim, floors):
+    """Register independent ladders (floors) of 3 sections, each fed by its own source."""
+    for floor in range(floors):
+        source = circuit.PowerSrc(ddp=10.0 + floor)
+        sim.register_component(f'SRC_{floor}', source)
+        previous = source.one
+        for index in range(3):
+            segment = circuit.Transducers(res=1.0 + index)
+            rung = circuit.Transducers(res=5.0)
+            sim.register_component(f'S{index}_{floor}', segment)
+            sim.register_component(f'R{index}_{floor}', rung)
+            sim.connect(previous, segment.one)
+            sim.connect(segment.two, rung.one)
+            sim.connect(rung.two, source.two)
+            previous = segment.two
+    return sim
+
+
+def test_islands_are_solved_independently():
+    sim = _floors(circuit.Simulator(), 3)
+    sim.reference = sim.get_component('SRC_1').two
+    result = sim.simulate()
+    assert len(sim.topology.islands) == 3
+
+    threaded = _floors(circuit.Simulator(), 3)
+    with concurrent.futures.ThreadPoolExecutor(2) as executor:
+        threaded.executor = executor
+        threaded_result = threaded.simulate()
+
+    for floor in range(3):
+        alone = _floors(circuit.Simulator(), 1)
+        alone.get_component('SRC_0').ddp = 10.0 + floor
+        alone.reference = alone.get_component('SRC_0').two
+        alone_result = alone.simulate()
+        for name in alone.components:
+            island_name = name[:-1] + str(floor)
+            assert abs(result[island_name][2] - alone_result[name][2]) < 1e-12
+            assert abs(threaded_result[island_name][2] - alone_result[name][2]) < 1e-12
+
+
+def test_series_parallel_reduction_matches_full_solve():
+    expected = SM.simulate()
+    SM.reduce = True
+    try:
+        result = SM.simulate()
+        assert SM.topology.size == 1
+    finally:
+        SM.reduce = False
+    for name in SM.components:
+        assert abs(result[name][0] - expected[name][0]) < 1e-12
+        assert abs(result[name][2] - expected[name][2]) < 1e-12
+
+    sim = _floors(circuit.Simulator(), 1)
+    extra = circuit.Transducers(res=4.0)
+    sim.register_component('S_PARALLEL', extra)
+    sim.connect(sim.get_component('S2_0').one, extra.one)
+    sim.connect(sim.get_component('S2_0').two, extra.two)
+    expected = sim.simulate()
+    sim.reduce = True
+    result = sim.simulate()
+    for name in sim.components:
+        assert abs(result[name][2] - expected[name][2]) < 1e-12
+
+
+def test_metered_flows_follow_sources_and_resistances():
+    sim = _ladder(6)
+    sim.register_component('FLOW', circuit.FlowSrc(cur=0.5))
+    sim.connect(sim.get_component('FLOW').one, sim.get_component('S3').two)
+    sim.connect(sim.get_component('FLOW').two, sim.get_component('SRC').two)
+    meters = ['S0', 'R3', 'SRC']
+    for name, value in (('SRC', 7.0), ('FLOW', 2.0), ('S2', 4.0)):
+        component = sim.get_component(name)
+        if isinstance(component, circuit.Transducers):
+            component.res = value
+        elif isinstance(component, circuit.PowerSrc):
+            component.ddp = value
+        else:
+            component.cur = value
+        flows = sim.metered_flows(meters)
+        result = sim.simulate()
+        for meter, flow in zip(meters, flows):
+            assert abs(flow - result[meter][2]) < 1e-12
+
+
+def _star(branches):
+    """Main pipe feeding branches that end in a tap to ground."""
+    sim = circuit.Simulator()
+    sim.register_component('SRC', circuit.PowerSrc(ddp=10))
+    sim.register_component('MAIN', circuit.Transducers(res=0.5))
+    sim.connect(sim.get_component('SRC').one, sim.get_component('MAIN').one)
+    for index in range(branches):
+        sim.register_component(f'B{index}', circuit.Transducers(res=1.0 + index % 3))
+        sim.register_component(f'TAP{index}', circuit.Transducers(res=10.0))
+        sim.connect(sim.get_component('MAIN').two, sim.get_component(f'B{index}').one)
+        sim.connect(sim.get_component(f'B{index}').two, sim.get_component(f'TAP{index}').one)
+        sim.connect(sim.get_component(f'TAP{index}').two, sim.get_component('SRC').two)
+    sim.reference = sim.get_component('SRC').two
+    return sim
+
+
+def test_tree_sweep_matches_nodal_solve():
+    tree = _star(64)
+    nodal = _star(64)
+    nodal.solver = 'dense'
+    assert tree.topology.tree is not None
+    for name, value in (('SRC', 25.0), ('B3', 7.0)):
+        for sim in (tree, nodal):
+            if name == 'SRC':
+                sim.get_component(name).ddp = value
+            else:
+                sim.get_component(name).res = value
+        expected, result = nodal.simulate(), tree.simulate()
+        assert max(abs(result.cur - expected.cur)) < 1e-12
+
+    assert _ladder(64).topology.tree is None
+    mesh = circuit.Transducers(res=2.0)
+    tree.register_component('MESH', mesh)
+    tree.connect(tree.get_component('B0').two, mesh.one)
+    tree.connect(tree.get_component('B1').two, mesh.two)
+    assert tree.topology.tree is None
+
+
+def test_solver_backends_match_and_show_in_stats():
+    expected = _star(64).simulate()
+    for solver in circuit.SOLVERS:
+        sim = _star(64)
+        sim.solver = solver
+        sim.profiling = True
+        result = sim.simulate()
+        assert sim.stats.solver == solver
+        assert max(abs(result.cur - expected.cur)) < 1e-9
+
+
+def test_conjugate_gradient_warm_starts_from_last_tick():
+    nodal = _ladder(200)
+    nodal.solver = 'dense'
+    iterations = dict()
+    for preconditioner in circuit.CG_PRECONDITIONERS:
+        sim = _ladder(200)
+        sim.solver = 'cg'
+        sim.cg_preconditioner = preconditioner
+        sim.profiling = True
+        for ddp in (10.0, 10.01):
+            for simulator in (nodal, sim):
+                simulator.get_component('SRC').ddp = ddp
+            expected, result = nodal.simulate(), sim.simulate()
+            iterations[preconditioner, ddp] = sim.stats.counters['iterations']
+            assert max(abs(result.cur - expected.cur)) < 1e-8
+    assert iterations['jacobi', 10.01] < iterations['jacobi', 10.0]
+    # The incomplete Cholesky factorization of a ladder has no fill-in: it is exact.
+    assert iterations['ic', 10.0] == 1
+
+
+def _mesh(side):
+    """Square mesh of transducers fed at one corner, with a tap to ground on every node."""
+    sim = circuit.Simulator()
+    sim.register_component('SRC', circuit.PowerSrc(ddp=10))
+    ground = sim.get_component('SRC').two
+    nodes = list()
+    for index in range(side*side):
+        sim.register_component(f'TAP{index}', circuit.Transducers(res=50.0))
+        sim.connect(sim.get_component(f'TAP{index}').two, ground)
+        nodes.append(sim.get_component(f'TAP{index}').one)
+    sim.connect(sim.get_component('SRC').one, nodes[0])
+    for index in range(side*side):
+        row, col = divmod(index, side)
+        for neighbour, name in ((index + 1, 'H'), (index + side, 'V')):
+            if (name == 'H' and col + 1 < side) or (name == 'V' and row + 1 < side):
+                sim.register_component(f'{name}{index}', circuit.Transducers(res=1.0 + index % 5))
+                sim.connect(nodes[index], sim.get_component(f'{name}{index}').one)
+                sim.connect(sim.get_component(f'{name}{index}').two, nodes[neighbour])
+    sim.reference = ground
+    return sim
+
+
+def test_incomplete_cholesky_is_symmetric_on_a_mesh(monkeypatch):
+    # A mesh fills in: the incomplete factors drop entries and L·U is not symmetric.
+    current_cg = circuit.sparse_linalg.cg
+    preconditioners = list()
+
+    def cg(*args, **kwargs):
+        preconditioners.append(kwargs['M'])
+        return current_cg(*args, **kwargs)
+
+    nodal = _mesh(12)
+    nodal.solver = 'dense'
+    sim = _mesh(12)
+    sim.solver = 'cg'
+    sim.cg_preconditioner = 'ic'
+    monkeypatch.setattr(circuit.sparse_linalg, 'cg', cg)
+    assert max(abs(sim.simulate().cur - nodal.simulate().cur)) < 1e-8
+
+    size = preconditioners[0].shape[0]
+    columns = [preconditioners[0].matvec([float(row == col) for row in range(size)])
+               for col in range(0, size, 7)]
+    for col, column in zip(range(0, size, 7), columns):
+        for other, other_column in zip(range(0, size, 7), columns):
+            assert abs(column[other] - other_column[col]) < 1e-12*max(abs(column))
+
+
+def test_conjugate_gradient_with_scipy_before_rtol(monkeypatch):
+    # Scipy 1.10, the last release for the Python 3.8 backend image, names rtol tol.
+    current_linalg = circuit.sparse_linalg
+
+    class LegacyLinalg:
+        LinearOperator = current_linalg.LinearOperator
+        spilu = current_linalg.spilu
+
+        @staticmethod
+        def cg(A, b, x0=None, tol=1e-05, maxiter=None, M=None, callback=None, atol=None):
+            return current_linalg.cg(A, b, x0=x0, rtol=tol, maxiter=maxiter, M=M,
+                                     callback=callback, atol=atol)
+
+    nodal = _ladder(50)
+    nodal.solver = 'dense'
+    sim = _ladder(50)
+    sim.solver = 'cg'
+    monkeypatch.setattr(circuit, 'sparse_linalg', LegacyLinalg)
+    monkeypatch.setattr(circuit, 'CG_TOLERANCE_KEYWORD', 'tol')
+    assert max(abs(sim.simulate().cur - nodal.simulate().cur)) < 1e-8
+
+
+def _water_mains(element, **kwargs):
+    """Source and booster pump feeding two pipes in parallel to ground."""
+    sim = circuit.Simulator()
+    sim.register_component('SRC', circuit.PowerSrc(ddp=50.0))
+    sim.register_component('PUMP', circuit.PowerSrc(ddp=20.0))
+    for name, res in (('A', 1.0), ('B', 2.0), ('C', 0.5), ('D', 3.0)):
+        sim.register_component(name, element(res=res, **kwargs))
+    component = sim.get_component
+    ground = component('SRC').two
+    sim.connect(component('SRC').one, component('A').one)
+    sim.connect(component('A').two, component('PUMP').two)
+    sim.connect(component('PUMP').one, component('B').one)
+    for name in ('C', 'D'):
+        sim.connect(component('B').two, component(name).one)
+        sim.connect(component(name).two, ground)
+    sim.reference = ground
+    return sim
+
+
+def test_pipes_follow_head_loss_law():
+    for exponent in (2.0, 1.852):
+        sim = _water_mains(circuit.Pipe, exponent=exponent)
+        sim.profiling = True
+        for ddp in (50.0, 50.5, 50.6):
+            sim.get_component('SRC').ddp = ddp
+            sim.simulate()
+            for name in 'ABCD':
+                pipe = sim.get_component(name)
+                assert abs(pipe.ddp - pipe.res*abs(pipe.cur)**(exponent - 1)*pipe.cur) < 1e-9
+            heads = sum(sim.get_component(name).ddp for name in 'ABC')
+            assert abs(heads - ddp - 20.0) < 1e-9
+            flows = sim.get_component('C').cur + sim.get_component('D').cur
+            assert abs(flows - sim.get_component('A').cur) < 1e-9
+        # Warm started with the kept Jacobian.
+        assert sim.stats.counters['newton_iterations'] <= 3
+        assert 'factorizations' not in sim.stats.counters
+
+    # Pipes with a linear head loss are transducers.
+    pipes = _water_mains(circuit.Pipe, exponent=1.0).simulate()
+    transducers = _water_mains(circuit.Transducers).simulate()
+    assert max(abs(pipes.cur - transducers.cur)) < 1e-9
+
+
+def _tank_feed():
+    """Source filling a tank through a pipe with inertia, with a drain to ground."""
+    sim = circuit.Simulator()
+    sim.register_component('SRC', circuit.PowerSrc(ddp=10.0))
+    sim.register_component('FEED', circuit.Inertia(res=2.0, ind=0.5))
+    sim.register_component('TANK', circuit.Tank(cap=3.0, ddp=0.0))
+    sim.register_component('DRAIN', circuit.Transducers(res=8.0))
+    component = sim.get_component
+    ground = component('SRC').two
+    sim.connect(component('SRC').one, component('FEED').one)
+    for name in ('TANK', 'DRAIN'):
+        sim.connect(component('FEED').two, component(name).one)
+        sim.connect(component(name).two, ground)
+    sim.reference = ground
+    return sim
+
+
+def test_transient_fills_tank_with_one_factorization():
+    sim = _tank_feed()
+    sim.get_component('FEED').cur = 0.0
+    steady = _tank_feed().simulate()
+    assert steady['TANK'][2] == 0.0 and abs(steady['TANK'][0] - 8.0) < 1e-12
+
+    sim.profiling = True
+    steps = sim.simulate_transient(0.05, 400)
+    assert sim.get_component('TANK').ddp == 0.0  # lazy
+    factorizations = 0
+    for step, result in enumerate(steps, 1):
+        factorizations += sim.stats.counters.get('factorizations', 0)
+        if step == 40:
+            assert abs(result['FEED'][2] - result['TANK'][2] - result['DRAIN'][2]) < 1e-12
+    # Time constant of the tank level: cap·(2 || 8) = 4.8 s, slowed by the inertia.
+    level = sim.get_component('TANK').ddp
+    assert abs(level - 8.0*(1.0 - math.exp(-20.0/4.8))) < 0.05
+    assert factorizations == 1
+
+    for method in circuit.TRANSIENT_METHODS:
+        sim = _tank_feed()
+        sim.simulate()
+        for result in sim.simulate_transient(0.1, 10, method):
+            assert abs(result['TANK'][0] - 8.0) < 1e-9 and abs(result['TANK'][2]) < 1e-9
+
+
+def test_contingency_scan_matches_closing_each_segment():
+    meters = ['SRC', 'MAIN', 'B0', 'TAP5']
+    segments = ['MAIN', 'B0', 'TAP1', 'B5']
+    for reduce, executor in ((False, None),
+                             (True, concurrent.futures.ThreadPoolExecutor(max_workers=2))):
+        sim = _star(8)
+        sim.reduce = reduce
+        sim.executor = executor
+        deltas = sim.contingency_scan(meters, segments)
+        assert deltas.shape == (len(segments), len(meters))
+
+        base = sim.simulate()
+        for row, segment in enumerate(segments):
+            sim.get_component(segment).res = float('inf')
+            closed = sim.simulate()
+            sim.get_component(segment).res = base[segment][1]
+            for col, meter in enumerate(meters):
+                assert abs(deltas[row, col] - (closed[meter][2] - base[meter][2])) < 1e-12
+        assert len(sim.contingency_scan(meters)) == 17
+
+
+def test_contingency_scan_without_unknowns():
+    # Reduced, the segment in series with the tap leaves no node equations.
+    meters = ['G0_2', 'T0_2', 'SRC0']
+    segments = ['G0_2', 'T0_2']
+    for reduce in (False, True):
+        sim = circuit.Simulator()
+        sim.register_component('SRC0', circuit.PowerSrc(ddp=10))
+        sim.register_component('T0_2', circuit.Transducers(res=3.0))
+        sim.register_component('G0_2', circuit.Transducers(res=25.0))
+        sim.connect(sim.get_component('SRC0').two, sim.get_component('T0_2').one)
+        sim.connect(sim.get_component('T0_2').two, sim.get_component('G0_2').one)
+        sim.connect(sim.get_component('G0_2').two, sim.get_component('SRC0').one)
+        sim.reference = sim.get_component('SRC0').one
+        sim.reduce = reduce
+        deltas = sim.contingency_scan(meters, segments)
+
+        base = sim.simulate()
+        for row, segment in enumerate(segments):
+            sim.get_component(segment).res = float('inf')
+            closed = sim.simulate()
+            sim.get_component(segment).res = base[segment][1]
+            for col, meter in enumerate(meters):
+                assert abs(closed[meter][2] - base[meter][2]) > 0.3
+                assert abs(deltas[row, col] - (closed[meter][2] - base[meter][2])) < 1e-12
+
+
+def test_leak_ranking_locates_a_leak():
+    meters = ['SRC', 'MAIN', 'B0', 'B3', 'TAP3', 'TAP5']
+    sim = _star(8)
+    nodes, sensitivities = sim.leak_sensitivities(meters)
+    assert sensitivities.shape == (len(nodes), len(meters)) and 'B3.two' in nodes
+
+    base = sim.simulate()
+    sim.register_component('LEAK', circuit.FlowSrc(cur=0.2))
+    sim.connect(sim.get_component('LEAK').two, sim.get_component('B3').two)
+    sim.connect(sim.get_component('LEAK').one, sim.get_component('SRC').two)
+    leaking = sim.simulate()
+    sim.deregister_component('LEAK')
+
+    deviations = [leaking[meter][2] - base[meter][2] for meter in meters]
+    node, score, leak = sim.rank_leaks(meters, deviations)[0]
+    assert node == 'B3.two' and abs(score - 1.0) < 1e-12 and abs(leak - 0.2) < 1e-12
+    assert len(sim.rank_leaks(meters, deviations, count=3)) == 3
+
+
+def test_state_estimate_weighs_meters_against_model():
+    meters = ['MAIN', 'B0', 'TAP3']
+    sim = _star(8)
+    sim.reduce = True
+    base = sim.simulate()
+    node_powers, _, residuals = sim.estimate_state(meters, [base[meter][2] for meter in meters])
+    assert max(abs(node_powers - base.node_powers)) < 1e-12 and max(abs(residuals)) < 1e-12
+
+    measured = [base['MAIN'][2], base['B0'][2], base['TAP3'][2] + 0.5]
+    names = sim.topology.names
+    previous = measured[2] - base['TAP3'][2]
+    for weight in (1.0, 100.0):
+        _, flows, residuals = sim.estimate_state(meters, measured, [1.0, 1.0, weight])
+        assert abs(residuals[2] - (measured[2] - flows[names['TAP3']])) < 1e-12
+        assert 0.0 < residuals[2] < previous and flows[names['B3']] > base['B3'][2]
+        previous = residuals[2]
+    assert residuals[2] < 0.01 and abs(flows[names['B3']] - flows[names['TAP3']]) < 1e-12
+
+
+def test_calibration_recovers_resistances_from_history():
+    meters = ['SRC', 'MAIN', 'B3', 'TAP3', 'B5', 'TAP5']
+    segments = ['MAIN', 'B3', 'TAP5']
+    sim = _star(8)
+    unit_flows = [flow/10.0 for flow in sim.metered_flows(meters)]
+    true = [sim.get_component(name).res for name in segments]
+
+    def history():
+        for chunk in range(3):
+            heads = [[8.0 + chunk + 0.5*sample] for sample in range(4)]
+            yield heads, [[head[0]*flow for flow in unit_flows] for head in heads]
+
+    for name, res in zip(segments, (1.0, 2.5, 4.0)):
+        sim.get_component(name).res = res
+    resistances, rms = sim.calibrate(meters, history(), segments)
+    assert rms < 1e-9
+    for name, fitted, res in zip(segments, resistances, true):
+        assert abs(fitted - res) < 1e-8 and sim.get_component(name).res == fitted
+
+
+def test_structurally_singular_circuit_fails_fast(caplog):
+    sim = _ladder(3)
+    sim.get_component('S2').res = float('inf')
+    sim.get_component('R2').res = float('inf')
+    sim.profiling = True
+    sim.simulate()
+    assert 'Singular node equations' in caplog.text
+    assert 'factorizations' in sim.stats.counters and 'nonzeros' not in sim.stats.counters